@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+
+class AppendBuffer:
+    """
+    Class collecting rows appended to a table, without copying the table on every append.
+
+    Every column is kept in a NumPy array with spare capacity, which doubles whenever it runs out,
+    so appending a row costs amortized O(1). The rows are merged into the table only when the whole
+    table is needed, see Segments. Appended rows must have higher IDs than the rows before them.
+
+    Args:
+        dtypes: data types of the columns of the table, as given by DataFrame.dtypes.
+        capacity: number of rows the buffer initially has room for.
+    """
+
+    def __init__(self, dtypes, capacity=64):
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.columns = {
+            column: np.empty(capacity, dtype=dtype) for column, dtype in dtypes.items()
+        }
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, count):
+        """Makes room for the given number of rows, doubling the capacity as often as needed."""
+
+        capacity = len(self.ids)
+        if self.size + count <= capacity:
+            return
+        while capacity < self.size + count:
+            capacity *= 2
+        self.ids = np.resize(self.ids, capacity)
+        for column, values in self.columns.items():
+            self.columns[column] = np.resize(values, capacity)
+
+    def append(self, rows):
+        """
+        Appends the rows of a DataFrame. Columns missing from the rows are filled with NaN,
+        and columns which aren't in the table are ignored.
+        """
+        count = len(rows)
+        self._reserve(count)
+        end = self.size + count
+        self.ids[self.size : end] = rows.index.values
+        for column, values in self.columns.items():
+            added = (
+                rows[column].to_numpy() if column in rows else np.full(count, np.nan)
+            )
+            if not np.can_cast(added.dtype, values.dtype, casting="same_kind"):
+                # Values which don't fit the type of the column are kept as objects, as Pandas would
+                values = self.columns[column] = values.astype(object)
+            values[self.size : end] = added
+        self.size = end
+
+    def get_rows(self, ids):
+        """Returns the rows with the given IDs as a DataFrame, IDs of other rows are ignored."""
+
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids[: self.size], ids)
+        found = positions < self.size
+        found[found] = self.ids[positions[found]] == ids[found]
+        return self._to_frame(positions[found])
+
+    def to_frame(self):
+        """Returns all rows as a DataFrame."""
+        return self._to_frame(slice(0, self.size))
+
+    def _to_frame(self, positions):
+        """Returns the rows at the given positions as a DataFrame, indexed by their IDs."""
+        return pd.DataFrame(
+            {column: values[positions] for column, values in self.columns.items()},
+            index=pd.Index(self.ids[positions], name="id"),
+        )
+
+    def clear(self):
+        """Removes all rows, keeping the capacity."""
+        self.size = 0
@@ -0,0 +1,68 @@
+import json
+import os
+
+import numpy as np
+
+# Helpers for persisting data derived from a source file (the video or a dataset) next to it.
+# Each artifact is a set of NumPy arrays saved as .npy files plus a .json file describing
+# the source they were built from, so that a stale artifact is detected and rebuilt.
+
+
+def get_fingerprint(source_path):
+    """Returns a description of the source file which changes whenever the file changes."""
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def save_arrays(artifact_path, source_path, arrays, **meta):
+    """
+    Saves the arrays of an artifact built from the given source file.
+
+    Arguments:
+        artifact_path: path of the artifact without extension, each array is saved as {artifact_path}.{name}.npy
+        source_path: the file the artifact was built from
+        arrays: dictionary of arrays by name
+        meta: additional values which have to match when the artifact is loaded
+    """
+    for name, array in arrays.items():
+        np.save(f"{artifact_path}.{name}.npy", array)
+    # The description is written last, so an interrupted save leaves a stale artifact
+    save_description(artifact_path, source_path, list(arrays), **meta)
+
+
+def save_description(artifact_path, source_path, names, **meta):
+    """
+    Saves the description of an artifact whose arrays have been written to {artifact_path}.{name}.npy already.
+    Used for arrays too large to be built in memory, which are written through np.lib.format.open_memmap instead.
+    """
+    with open(f"{artifact_path}.json", "w") as f:
+        json.dump(
+            {
+                "source": get_fingerprint(source_path),
+                "arrays": names,
+                "meta": meta,
+            },
+            f,
+        )
+
+
+def load_arrays(artifact_path, source_path, mmap_mode=None, **meta):
+    """
+    Returns the arrays of an artifact by name, or None if it doesn't exist or is stale.
+
+    An artifact is stale if the source file or any of the additional values has changed since it was saved.
+    With mmap_mode, the arrays are memory-mapped instead of read into memory.
+    """
+    try:
+        with open(f"{artifact_path}.json") as f:
+            description = json.load(f)
+        if description["source"] != get_fingerprint(source_path):
+            return None
+        if description["meta"] != meta:
+            return None
+        return {
+            name: np.load(f"{artifact_path}.{name}.npy", mmap_mode=mmap_mode)
+            for name in description["arrays"]
+        }
+    except (OSError, ValueError, KeyError):
+        return None
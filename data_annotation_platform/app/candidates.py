@@ -0,0 +1,214 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import settings
+from app.artifacts import load_arrays, save_arrays
+from app.geometry import GeometryStore
+
+# Candidate graphs by path, shared by all sessions
+_graphs = {}
+# Endpoint index of a process building a candidate graph
+_worker_index = None
+
+
+class EndpointIndex:
+    """
+    Class finding the trajectories which could continue a given trajectory, ranked by a gap score.
+
+    A trajectory can only be continued by trajectories starting shortly after it ends, near its end point.
+    The start points of all trajectories are sorted by their first frame, so the trajectories starting
+    within the time window are a slice found with two binary searches. The gap between the end point and
+    every start point in the slice is then scored at once, and only the best ones are sorted.
+
+    The score of a gap is its distance in pixels plus a cost for every frame of the gap, so that
+    a close start point in the near future ranks first.
+
+    Args:
+        ids: IDs of the trajectories.
+        frames: first frame of each trajectory.
+        xs: x coordinate of the first point of each trajectory.
+        ys: y coordinate of the first point of each trajectory.
+    """
+
+    def __init__(self, ids, frames, xs, ys):
+        order = np.argsort(frames, kind="stable")
+        self.ids = np.asarray(ids)[order]
+        self.frames = np.asarray(frames)[order]
+        self.xs = np.asarray(xs, dtype=np.float32)[order]
+        self.ys = np.asarray(ys, dtype=np.float32)[order]
+
+    def query(
+        self,
+        frame_nr,
+        x,
+        y,
+        window=settings.CANDIDATE_WINDOW,
+        count=settings.CANDIDATE_COUNT,
+        frame_cost=settings.CANDIDATE_FRAME_COST,
+    ):
+        """
+        Returns the IDs and scores of the best trajectories starting within the window after the given frame,
+        from the best to the worst, for a trajectory ending at the given point.
+        """
+        lo = np.searchsorted(self.frames, frame_nr, side="left")
+        hi = np.searchsorted(self.frames, frame_nr + window, side="right")
+        gaps = self.frames[lo:hi] - frame_nr
+        scores = np.hypot(self.xs[lo:hi] - x, self.ys[lo:hi] - y) + frame_cost * gaps
+        if len(scores) > count:
+            best = np.argpartition(scores, count)[:count]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(scores[best], kind="stable")]
+        return self.ids[lo:hi][best], scores[best]
+
+
+class CandidateGraph:
+    """
+    Class holding the ranked candidates of every trajectory, precomputed for the whole recording.
+
+    The graph is stored in compressed sparse row form: the candidates of the trajectory at position i
+    of rows are ids[offsets[i]:offsets[i + 1]], from the best to the worst, with their gap scores in scores.
+    Looking up the candidates of a trajectory is a binary search and a slice of the arrays.
+
+    Args:
+        offsets: array of length (number of rows + 1) with the start of every row's candidates in ids.
+        ids: IDs of the candidates, row after row.
+        scores: gap scores of the candidates.
+        rows: sorted IDs of the trajectories the graph was built for.
+    """
+
+    def __init__(self, offsets, ids, scores, rows):
+        self.offsets = offsets
+        self.ids = ids
+        self.scores = scores
+        self.rows = rows
+
+    def get_candidates(self, id):
+        """Returns the IDs and scores of the candidates of a trajectory, or None if it isn't in the graph."""
+        i = np.searchsorted(self.rows, id)
+        if i == len(self.rows) or self.rows[i] != id:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.ids[start:end], self.scores[start:end]
+
+    @staticmethod
+    def get_meta():
+        """Returns the settings a graph is built with, it has to be rebuilt when they change."""
+        return {
+            "window": settings.CANDIDATE_WINDOW,
+            "count": settings.CANDIDATE_COUNT,
+            "frame_cost": settings.CANDIDATE_FRAME_COST,
+        }
+
+    @classmethod
+    def build(cls, source_path, window_size=settings.FRAME_INTERVAL, workers=None):
+        """
+        Builds the graph of the trajectories in the source file with a pool of worker processes.
+        The trajectories are split into time windows by their last frame, and every window is a task of the pool.
+        """
+        data = pd.read_pickle(source_path)
+        geometry = GeometryStore.from_lists(data.index.values, data["xs"], data["ys"])
+        ids = geometry.ids
+        start_xs, start_ys = geometry.get_points(ids, 0)
+        end_xs, end_ys = geometry.get_points(ids, -1)
+        frames_out = data.loc[ids, "frame_out"].values
+
+        windows = frames_out // window_size
+        order = np.argsort(windows, kind="stable")
+        bounds = np.flatnonzero(np.diff(windows[order])) + 1
+        tasks = [
+            (rows, ids[rows], frames_out[rows], end_xs[rows], end_ys[rows])
+            for rows in np.split(order, bounds)
+            if len(rows)
+        ]
+
+        with ProcessPoolExecutor(
+            workers,
+            initializer=_init_worker,
+            initargs=(ids, data.loc[ids, "frame_in"].values, start_xs, start_ys),
+        ) as executor:
+            results = list(executor.map(_find_candidates, tasks))
+
+        # Put the candidates of all windows in the order of the rows
+        rows = np.concatenate([task[0] for task in tasks] + [np.empty(0, np.int64)])
+        counts = np.concatenate([r[0] for r in results] + [np.empty(0, np.int64)])
+        entries = np.argsort(np.repeat(rows, counts), kind="stable")
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        offsets[1:][rows] = counts
+        np.cumsum(offsets, out=offsets)
+        candidates = np.concatenate([r[1] for r in results] + [np.empty(0, np.int32)])
+        scores = np.concatenate([r[2] for r in results] + [np.empty(0, np.float32)])
+        return cls(
+            offsets,
+            candidates[entries].astype(np.int32),
+            scores[entries].astype(np.float32),
+            ids,
+        )
+
+    @classmethod
+    def build_and_save(cls, source_path, graph_path, workers=None):
+        """Builds the graph of the trajectories in the source file and saves it at graph_path."""
+        graph = cls.build(source_path, workers=workers)
+        save_arrays(
+            graph_path,
+            source_path,
+            {
+                "offsets": graph.offsets,
+                "ids": graph.ids,
+                "scores": graph.scores,
+                "rows": graph.rows,
+            },
+            **cls.get_meta(),
+        )
+        return graph
+
+
+def _init_worker(ids, frames, xs, ys):
+    """Builds the endpoint index of a process building a candidate graph."""
+    global _worker_index
+    _worker_index = EndpointIndex(ids, frames, xs, ys)
+
+
+def _find_candidates(task):
+    """
+    Returns the candidates of the trajectories of a time window, computed in a worker process:
+    the number of candidates of every trajectory, followed by the IDs and scores of all candidates.
+    """
+    _, ids, frames, xs, ys = task
+    counts, candidates, scores = [], [], []
+    for id, frame_nr, x, y in zip(ids, frames, xs, ys):
+        # Query one more, as the trajectory itself is found if it has no length
+        found, found_scores = _worker_index.query(
+            frame_nr, x, y, count=settings.CANDIDATE_COUNT + 1
+        )
+        keep = found != id
+        found = found[keep][: settings.CANDIDATE_COUNT]
+        counts.append(len(found))
+        candidates.append(found)
+        scores.append(found_scores[keep][: settings.CANDIDATE_COUNT])
+    return (
+        np.array(counts, dtype=np.int64),
+        np.concatenate(candidates),
+        np.concatenate(scores),
+    )
+
+
+def get_candidate_graph(source_path, graph_path):
+    """
+    Returns the candidate graph of the trajectories if one was built for their current version and
+    the current candidate settings, otherwise None. The graph is loaded only once per server process.
+    """
+    if graph_path not in _graphs:
+        arrays = load_arrays(
+            graph_path, source_path, mmap_mode="r", **CandidateGraph.get_meta()
+        )
+        _graphs[graph_path] = (
+            CandidateGraph(
+                arrays["offsets"], arrays["ids"], arrays["scores"], arrays["rows"]
+            )
+            if arrays is not None
+            else None
+        )
+    return _graphs[graph_path]
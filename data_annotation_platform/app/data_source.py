@@ -1,6 +1,12 @@
+import numpy as np
 import pandas as pd
 from bokeh.models import ColumnDataSource
 
+import settings
+from app.geometry import GeometryStore
+from app.incremental_view import IncrementalView
+from app.interval_index import IntervalIndex
+
 
 class DataSource:
     """
@@ -8,18 +14,38 @@ class DataSource:
 
     Args:
         source_path: Location of the Pickle file to be loaded as the data source.
+        frame_table: Optional precomputed FrameTable of the data source, used by the interval index.
 
     Attributes:
-        data: Data loaded from file as a Pandas DataFrame.
+        data: Data loaded from file as a Pandas DataFrame, without the coordinates of the lines.
+        geometry: GeometryStore holding the coordinates (xs and ys) of the lines of the data points.
         views: List of views extracted from the data. Each of this views is an attribute on its own.
+        incremental_views: IncrementalView of the views which are updated by sending only changed rows.
         current_frame_view: The only default view. This view holds data relevant only to the currently displayed frame.
         selected_ids: IDs of data points currently selected from the UI.
+        interval_index: index of the frames on which each data point is shown. It has to be kept up to date
+            by subclasses which add or remove data points.
     """
 
-    def __init__(self, source_path):
-        self.data = pd.read_pickle(source_path)
+    def __init__(self, source_path, frame_table=None):
+        data = pd.read_pickle(source_path)
+        self.geometry = GeometryStore.from_lists(
+            data.index.values, data["xs"], data["ys"]
+        )
+        self.data = data.drop(columns=["xs", "ys"])
+        self.interval_index = IntervalIndex(
+            self.data.index.values,
+            self.data["frame_in"].values,
+            self.data["frame_out"].values + settings.FRAMES_AFTER_END,
+            table=frame_table,
+        )
         self.views = []
         self._register_view("current_frame_view", {})
+        self.incremental_views = {
+            "current_frame_view": IncrementalView(
+                self.current_frame_view, empty_row={"xs": [], "ys": []}
+            )
+        }
         self.selected_ids = []
 
     def _register_view(self, name, data):
@@ -29,52 +55,93 @@ class DataSource:
         setattr(self, name, ColumnDataSource(data))
         self.views.append(getattr(self, name))
 
+    def get_active_data(self, frame_nr):
+        """Returns the data points shown on the given frame, looked up in the interval index."""
+        return self.data.loc[self.interval_index.query(frame_nr)]
+
     def get_frame_subset(self, frame_nr):
         """
         Abstract method. Returns a subset of data for a given frame. Implementation depends on the data source.
         """
         raise NotImplementedError
 
-    def update_views(self, frame_nr):
+    def get_view_data(self, subset, lines=True):
         """
-        Updates the current frame view with data for the given frame.
+        Returns the data of a view holding the given subset of data points.
+
+        Numeric columns are 32-bit NumPy arrays and the points of every line are float32 arrays,
+        which Bokeh sends to the browser as binary buffers instead of lists of numbers.
+        The lines are only included if the view is drawn.
+        """
+        data = {}
+        for name, values in subset.items():
+            if values.dtype.kind in "iu":
+                data[name] = values.values.astype(np.int32)
+            elif values.dtype.kind == "f":
+                data[name] = values.values.astype(np.float32)
+            else:
+                data[name] = values.tolist()
+        data["id"] = subset.index.values.astype(np.int32)
+        if lines:
+            data["xs"], data["ys"] = self.geometry.get_lines(subset.index.values)
+        return data
+
+    def get_views_data(self, frame_nr):
+        """
+        Returns the data of the views for the given frame, keyed by the name of the view.
+        It doesn't modify any Bokeh model, but reads the data, which changes under the document lock.
         """
         subset = self.get_frame_subset(frame_nr)
-        line_style = self.get_line_style(subset)
-        self.current_frame_view.data = {
-            **subset.to_dict(orient="list"),
-            "id": subset.index.values,
-            **line_style,
+        return {
+            "current_frame_view": {
+                **self.get_view_data(subset),
+                **self.get_line_style(subset),
+            }
         }
 
+    def set_views_data(self, views_data):
+        """
+        Updates the views with the data returned by get_views_data.
+        Incremental views only receive the rows that changed, the other views are replaced.
+        """
+        for name, data in views_data.items():
+            if name in self.incremental_views:
+                self.incremental_views[name].update(data)
+            else:
+                getattr(self, name).data = data
+
+    def invalidate_views(self):
+        """
+        Marks the incremental views as changed, so that the next update replaces their data.
+        Must be called whenever data points change without the set of shown points changing.
+        """
+        for view in self.incremental_views.values():
+            view.invalidate()
+
+    def update_views(self, frame_nr):
+        """
+        Updates the current frame view with data for the given frame.
+        """
+        self.set_views_data(self.get_views_data(frame_nr))
+
     def get_line_style(self, subset):
         """
-        Returns default styles for lines according to their class.
-        """
-        colors = [
-            "red",
-            "magenta",
-            "green",
-            "orange",
-            "cyan",
-            "yellow",
-            "blue",
-            "black",
-            "navy",
-        ]
-        line_color = [colors[int(i)] for i in subset["class"]]
-        line_dash = ["solid" for i in subset["class"]]
-        return dict(line_color=line_color, line_dash=line_dash)
+        Returns the style of lines, which is their class by default.
+        The browser maps the style to the color of the line, see TrajectoryPlot.
+        """
+        return dict(line_style=subset["class"].to_numpy(np.int8))
 
     def connect(self, t1_id, t2_id):
         """Returns a new segment by connecting two trajectories with given IDs."""
         t1 = self.data.iloc[t1_id]
         t2 = self.data.iloc[t2_id]
+        x1, y1 = self.geometry.get_point(t1.name, -1)
+        x2, y2 = self.geometry.get_point(t2.name, 0)
         connection = pd.DataFrame(
             {
                 "class": t1["class"],
-                "xs": [[t1["xs"][-1], t2["xs"][0]]],
-                "ys": [[t1["ys"][-1], t2["ys"][0]]],
+                "xs": [[x1, x2]],
+                "ys": [[y1, y2]],
                 "frame_in": t1["frame_out"],
                 "frame_out": t2["frame_in"],
                 "correct": True,
@@ -107,6 +174,11 @@ class DataSource:
             self.selected_ids.append(traj_id)
             self.current_frame_view.selected.indices = old + new
 
-    def export_data(self, path):
-        """Saves the data into a Pickle file."""
-        self.data.to_pickle(f"{path}.pkl")
+    def to_frame(self):
+        """Returns the data with the coordinates of the lines as lists, as in the loaded Pickle file."""
+
+        data = self.data.copy()
+        xs, ys = self.geometry.get_lines(data.index.values)
+        data.insert(0, "xs", [x.tolist() for x in xs])
+        data.insert(1, "ys", [y.tolist() for y in ys])
+        return data
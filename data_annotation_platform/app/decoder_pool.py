@@ -0,0 +1,276 @@
+import atexit
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from multiprocessing import connection, shared_memory
+
+import cv2
+import numpy as np
+
+import settings
+from app.artifacts import load_arrays
+from app.frames import FrameProvider
+from app.keyframes import KeyframeIndex
+
+# The decoder pool of the server process, shared by all sessions
+_pool = None
+
+
+def _run_worker(
+    video_path, keyframe_index_path, output_size, shm_name, shape, requests, results
+):
+    """
+    Main loop of a decoder process.
+    Decodes the requested frames into their slot of the shared memory and reports them as done.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    frames = _create_decoder(video_path, keyframe_index_path, output_size)
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        frame_nr, slot = request
+        frame = frames.get_frame(frame_nr)
+        if frame is not None and frame.shape == slots.shape[1:]:
+            slots[slot] = frame
+            results.send((frame_nr, slot, True))
+        else:
+            results.send((frame_nr, slot, False))
+    shm.close()
+
+
+def _create_decoder(video_path, keyframe_index_path, output_size):
+    """
+    Returns a FrameProvider decoding the video without a cache,
+    the shared memory is the cache and the decoder only has to keep its position.
+    """
+    arrays = load_arrays(keyframe_index_path, video_path)
+    return FrameProvider(
+        cv2.VideoCapture(video_path),
+        cache_size=0,
+        output_size=output_size,
+        keyframes=KeyframeIndex(arrays["keyframes"]) if arrays is not None else None,
+    )
+
+
+class DecoderPool:
+    """
+    Class decoding frames for all sessions in a pool of worker processes.
+
+    Decoded frames are delivered through slots in a shared memory block, which also serves as a cache
+    shared by all sessions. Requests for a frame which is already being decoded wait for the same
+    result instead of decoding it again. Frames are assigned to workers by blocks of consecutive frames,
+    so every worker keeps reading forward within its blocks instead of seeking.
+
+    If a worker died or takes longer than the timeout, the frame is decoded in the server process instead.
+    The requests of a worker which died are failed and their slots are released, so neither a waiting
+    session nor the pool is left waiting for a frame which is never decoded.
+    It provides the same methods as FrameProvider, so it can be used by a FramePrefetcher as well.
+
+    Args:
+        video_path: path of the video to decode.
+        keyframe_index_path: path of the keyframe index used by the workers, if it was built.
+        workers: number of decoder processes.
+        slots: number of frames held in the shared memory.
+        block: number of consecutive frames assigned to the same worker.
+        output_size: maximum (width, height) of the frames, as for FrameProvider.
+        timeout: seconds to wait for a worker before decoding the frame in the server process.
+
+    Attributes:
+        frame_count: number of frames in the video.
+    """
+
+    def __init__(
+        self,
+        video_path,
+        keyframe_index_path,
+        workers=settings.DECODER_WORKERS,
+        slots=settings.DECODER_SLOTS,
+        block=settings.DECODER_BLOCK,
+        output_size=settings.FRAME_OUTPUT_SIZE,
+        timeout=settings.DECODER_TIMEOUT,
+    ):
+        # Decoder of the server process, used when a worker fails. It also finds out the size of the slots
+        self._fallback = _create_decoder(video_path, keyframe_index_path, output_size)
+        self.frame_count = self._fallback.frame_count
+        self.read_ahead = self._fallback.read_ahead
+        shape = (slots, *self._fallback.get_frame(0).shape)
+
+        self.block = block
+        self.timeout = timeout
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self._slots = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+        # Slots holding decoded frames by frame number, least recently used first
+        self._decoded = OrderedDict()
+        self._free = list(range(slots))
+        # Futures of the frames being decoded and the slots they are decoded into, by frame number
+        self._pending = {}
+        self._condition = threading.Condition()
+
+        # Spawn instead of fork, the server process runs threads and an event loop
+        context = multiprocessing.get_context("spawn")
+        self._requests = [context.Queue() for _ in range(workers)]
+        # Every worker sends its results through its own pipe. A worker killed while sending
+        # only breaks its own pipe, where a shared queue would stay locked for all of them.
+        self._results = []
+        self._workers = []
+        for requests in self._requests:
+            reader, writer = context.Pipe(duplex=False)
+            worker = context.Process(
+                target=_run_worker,
+                args=(
+                    video_path,
+                    keyframe_index_path,
+                    output_size,
+                    self._shm.name,
+                    shape,
+                    requests,
+                    writer,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            # Only the worker holds the writing end, so its pipe is closed as soon as it dies
+            writer.close()
+            self._results.append(reader)
+            self._workers.append(worker)
+        self._stop_reader, self._stop_writer = context.Pipe(duplex=False)
+        threading.Thread(target=self._collect_results, daemon=True).start()
+
+    def get_frame(self, frame_nr):
+        """Returns a copy of the given frame, waiting for a worker to decode it if necessary."""
+
+        while True:
+            with self._condition:
+                if frame_nr in self._decoded:
+                    self._decoded.move_to_end(frame_nr)
+                    return self._slots[self._decoded[frame_nr]].copy()
+                future = None
+                if self._workers[self._get_worker(frame_nr)].is_alive():
+                    if frame_nr in self._pending:
+                        future, _ = self._pending[frame_nr]
+                    else:
+                        future = self._request(frame_nr)
+            if future is None:
+                return self._fallback.get_frame(frame_nr)
+            try:
+                ok = future.result(timeout=self.timeout)
+            except TimeoutError:
+                # The worker may still deliver the frame later, for the next requests
+                return self._fallback.get_frame(frame_nr)
+            if ok is None:
+                # The worker died before decoding the frame
+                return self._fallback.get_frame(frame_nr)
+            if not ok:
+                return None
+            # The frame is in the shared memory now, unless it was evicted again in the meantime
+
+    def is_cached(self, frame_nr):
+        """Returns whether the given frame is decoded or being decoded."""
+        return frame_nr in self._decoded or frame_nr in self._pending
+
+    def _request(self, frame_nr):
+        """
+        Sends the frame to its worker and returns the future of the result, None if no slot got free
+        within the timeout. Called with the lock held.
+        """
+        # Every slot is being written by a worker, wait until one of them is done
+        if not self._condition.wait_for(
+            lambda: self._free or self._decoded, timeout=self.timeout
+        ):
+            return None
+        if self._free:
+            slot = self._free.pop()
+        else:
+            _, slot = self._decoded.popitem(last=False)
+        future = Future()
+        self._pending[frame_nr] = (future, slot)
+        sent = False
+        try:
+            self._requests[self._get_worker(frame_nr)].put((frame_nr, slot))
+            sent = True
+        finally:
+            # A request which couldn't be sent never gets a result, so its slot is released right away
+            if not sent:
+                del self._pending[frame_nr]
+                self._free.append(slot)
+        return future
+
+    def _get_worker(self, frame_nr):
+        """Returns the index of the worker decoding the given frame."""
+        return frame_nr // self.block % len(self._requests)
+
+    def _collect_results(self):
+        """Main loop of the thread receiving decoded frames from the workers."""
+
+        readers = list(self._results)
+        checked = time.monotonic()
+        while True:
+            ready = connection.wait(readers + [self._stop_reader], timeout=self.timeout)
+            if self._stop_reader in ready:
+                break
+            for reader in ready:
+                try:
+                    self._finish(*reader.recv())
+                except (EOFError, OSError):
+                    # The worker died, its requests are failed below once it's gone
+                    readers.remove(reader)
+            # Workers are checked regularly even while results keep coming from the others
+            if time.monotonic() - checked >= self.timeout:
+                self._fail_dead_workers()
+                checked = time.monotonic()
+
+    def _finish(self, frame_nr, slot, ok):
+        """
+        Resolves the request of a frame with the result of its worker: True if it was decoded,
+        False if it doesn't exist and None if the worker died. The slot always goes back to the pool.
+        """
+        with self._condition:
+            # The request may have been failed already, when its worker was found dead
+            future, _ = self._pending.pop(frame_nr, (None, None))
+            if ok:
+                self._decoded[frame_nr] = slot
+            else:
+                self._free.append(slot)
+            self._condition.notify_all()
+        if future is not None:
+            future.set_result(ok)
+
+    def _fail_dead_workers(self):
+        """Fails the requests sent to workers which died, releasing their slots."""
+
+        with self._condition:
+            failed = [
+                (frame_nr, slot)
+                for frame_nr, (_, slot) in self._pending.items()
+                if not self._workers[self._get_worker(frame_nr)].is_alive()
+            ]
+        for frame_nr, slot in failed:
+            self._finish(frame_nr, slot, None)
+
+    def close(self):
+        """Stops the workers and releases the shared memory."""
+
+        for requests in self._requests:
+            requests.put(None)
+            # Requests left for a dead worker are never read, don't wait for them at exit
+            requests.cancel_join_thread()
+        self._stop_writer.send(None)
+        for worker in self._workers:
+            worker.join(timeout=1)
+        self._fallback.close()
+        self._shm.close()
+        self._shm.unlink()
+
+
+def get_decoder_pool(video_path, keyframe_index_path):
+    """Returns the decoder pool of the server process, starting it for the first session."""
+
+    global _pool
+    if _pool is None:
+        _pool = DecoderPool(video_path, keyframe_index_path)
+        atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+import settings
+from app.artifacts import load_arrays, save_arrays
+
+# Frame tables by path, shared by all sessions
+_tables = {}
+
+
+class FrameTable:
+    """
+    Class holding the IDs of the rows shown on every frame of a recording, precomputed for the whole recording.
+
+    The table is stored in compressed sparse row form: the IDs of the rows shown on frame f are
+    ids[offsets[f]:offsets[f + 1]], sorted. Looking up a frame is a single slice of the arrays,
+    which can be memory-mapped from disk.
+
+    Args:
+        offsets: array of length (number of frames + 1) with the start of every frame in ids.
+        ids: IDs of the rows shown on each frame, frame after frame.
+        rows: sorted IDs of all rows the table was built from.
+    """
+
+    def __init__(self, offsets, ids, rows):
+        self.offsets = offsets
+        self.ids = ids
+        self.rows = rows
+
+    def query(self, frame_nr):
+        """Returns the sorted IDs of the rows shown on the given frame."""
+        if not 0 <= frame_nr < len(self.offsets) - 1:
+            return np.empty(0, dtype=self.ids.dtype)
+        return self.ids[self.offsets[frame_nr] : self.offsets[frame_nr + 1]]
+
+    @classmethod
+    def build(cls, ids, starts, ends):
+        """Builds the table for rows shown from their start to their end frame (inclusive)."""
+
+        ids = np.asarray(ids, dtype=np.int32)
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        starts = np.maximum(np.asarray(starts, dtype=np.int64)[order], 0)
+        ends = np.asarray(ends, dtype=np.int64)[order]
+        lengths = np.maximum(ends - starts + 1, 0)
+
+        # Expand every row into one entry per frame it is shown on
+        first = np.cumsum(lengths) - lengths
+        frames = np.repeat(starts - first, lengths) + np.arange(lengths.sum())
+        # A stable sort keeps the IDs of each frame sorted, as the rows are sorted by ID
+        entries = np.argsort(frames, kind="stable")
+        frame_count = int(ends.max()) + 1 if len(ends) else 0
+        offsets = np.zeros(frame_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(frames, minlength=frame_count), out=offsets[1:])
+        return cls(offsets, np.repeat(ids, lengths)[entries], ids)
+
+    @classmethod
+    def load_or_build(cls, source_path, table_path):
+        """
+        Returns the table of the data source saved at table_path, memory-mapped.
+        The table is built and saved first if it's missing or if the data source has changed.
+        """
+        meta = {"frames_after_end": settings.FRAMES_AFTER_END}
+        arrays = load_arrays(table_path, source_path, mmap_mode="r", **meta)
+        if arrays is None:
+            data = pd.read_pickle(source_path)
+            table = cls.build(
+                data.index.values,
+                data["frame_in"].values,
+                data["frame_out"].values + settings.FRAMES_AFTER_END,
+            )
+            save_arrays(
+                table_path,
+                source_path,
+                {"offsets": table.offsets, "ids": table.ids, "rows": table.rows},
+                **meta,
+            )
+            arrays = load_arrays(table_path, source_path, mmap_mode="r", **meta)
+        return cls(arrays["offsets"], arrays["ids"], arrays["rows"])
+
+
+def get_frame_table(source_path, table_path):
+    """Returns the frame table of the data source, loading it only once per server process."""
+    if table_path not in _tables:
+        _tables[table_path] = FrameTable.load_or_build(source_path, table_path)
+    return _tables[table_path]
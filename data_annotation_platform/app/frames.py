@@ -0,0 +1,295 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import settings
+from app.artifacts import load_arrays
+
+# Frame stores by video path, shared by all sessions
+_frame_stores = {}
+
+
+class FrameProvider:
+    """
+    Class serving decoded frames of a video capture.
+
+    Seeking in a compressed video means decoding from the previous keyframe, so the provider
+    avoids it where possible. Frames shortly after the current position of the decoder are
+    reached by reading forward, and recently decoded frames are kept in an LRU cache bounded
+    by their size in bytes.
+    Frames larger than the output size are downscaled right after decoding, keeping their aspect ratio,
+    so neither the cache nor the plot ever holds more pixels than can be displayed.
+    The provider can be shared with a worker thread, access to the capture and the cache is locked.
+
+    Args:
+        cap: the OpenCV video capture to read frames from.
+        cache_size: maximum size of the cache in bytes.
+        read_ahead: maximum number of frames to read forward instead of seeking.
+        output_size: maximum (width, height) of the returned frames, None to keep the size of the video.
+        keyframes: optional KeyframeIndex of the video, used instead of the read_ahead window.
+
+    Attributes:
+        frame_count: number of frames in the video.
+        position: number of the frame that the next read from the capture returns, None if unknown.
+        cache: recently decoded frames by their frame number, least recently used first.
+        cache_bytes: current size of the cached frames in bytes.
+    """
+
+    def __init__(
+        self,
+        cap,
+        cache_size=settings.FRAME_CACHE_SIZE,
+        read_ahead=settings.FRAME_READ_AHEAD,
+        output_size=settings.FRAME_OUTPUT_SIZE,
+        keyframes=None,
+    ):
+        self.cap = cap
+        self.cache_size = cache_size
+        self.read_ahead = read_ahead
+        self.output_size = output_size
+        self.keyframes = keyframes
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.position = 0
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.lock = threading.Lock()
+
+    def get_frame(self, frame_nr):
+        """Returns the given frame, decoding it only if it isn't cached."""
+
+        with self.lock:
+            frame = self.cache.get(frame_nr)
+            if frame is not None:
+                self.cache.move_to_end(frame_nr)
+                return frame
+
+            frame = self.decode(frame_nr)
+            if frame is not None:
+                self.add_to_cache(frame_nr, frame)
+            return frame
+
+    def is_cached(self, frame_nr):
+        """Returns whether the given frame is in the cache."""
+        return frame_nr in self.cache
+
+    def decode(self, frame_nr):
+        """
+        Decodes the given frame, reading forward from the current position if it's close enough.
+        With a keyframe index, frames are always reached by reading forward from their keyframe
+        or from the current position if it's already past that keyframe.
+        """
+
+        if self.keyframes is not None:
+            keyframe = self.keyframes.get_keyframe(frame_nr)
+            # Reading forward from the current position is never more work than seeking to the keyframe
+            if self.position is None or not keyframe <= self.position <= frame_nr:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                self.position = keyframe
+            skip = frame_nr - self.position
+        else:
+            skip = frame_nr - self.position if self.position is not None else -1
+            if not 0 <= skip <= self.read_ahead:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_nr)
+                skip = 0
+        # Frames in between only need to be grabbed, which skips converting them
+        for _ in range(skip):
+            self.cap.grab()
+        ret, frame = self.cap.read()
+        # If the read failed the position of the decoder is unknown, so force a seek next time
+        self.position = frame_nr + 1 if ret else None
+        return self.resize(frame) if ret else None
+
+    def resize(self, frame):
+        """Downscales the frame to fit within the output size if it's larger, keeping its aspect ratio."""
+
+        if self.output_size is None:
+            return frame
+        w_out, h_out = self.output_size
+        h, w = frame.shape[:2]
+        # One factor for both dimensions, and frames are never upscaled
+        scale = min(w_out / w, h_out / h, 1)
+        if scale == 1:
+            return frame
+        size = (max(round(w * scale), 1), max(round(h * scale), 1))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def close(self):
+        """Releases the video capture and the cached frames."""
+        with self.lock:
+            self.cap.release()
+            self.cache.clear()
+            self.cache_bytes = 0
+
+    def add_to_cache(self, frame_nr, frame):
+        """Adds a frame to the cache and evicts the least recently used frames above the size limit."""
+
+        if frame_nr in self.cache:
+            self.cache.move_to_end(frame_nr)
+            return
+        self.cache[frame_nr] = frame
+        self.cache_bytes += frame.nbytes
+        while self.cache_bytes > self.cache_size and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.cache_bytes -= evicted.nbytes
+
+
+class FramePrefetcher:
+    """
+    Class decoding frames ahead of the user in a worker thread.
+
+    Every navigation request passes the frame that was jumped to and the direction of the move.
+    The worker then decodes the following frames in that direction into the cache of the provider,
+    so the next steps of the user only pick up frames that are ready. A new request interrupts
+    the frames left over from the previous one.
+
+    Args:
+        provider: the FrameProvider to decode frames with and whose cache is filled.
+        count: number of frames to decode ahead of the requested frame.
+    """
+
+    def __init__(self, provider, count=settings.PREFETCH_FRAMES):
+        self.provider = provider
+        self.count = count
+        self._request = None
+        self._generation = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def prefetch(self, frame_nr, direction):
+        """
+        Requests frames following the given frame to be decoded.
+
+        Arguments:
+            frame_nr: the frame the user has moved to
+            direction: positive when moving forward, negative when moving backward
+        """
+        if direction == 0:
+            return
+        with self._condition:
+            self._request = (frame_nr, 1 if direction > 0 else -1)
+            self._generation += 1
+            self._condition.notify()
+
+    def close(self):
+        """Stops the worker thread, waiting for the frame it's decoding."""
+        with self._condition:
+            self._stopped = True
+            self._generation += 1
+            self._condition.notify()
+        self._worker.join()
+
+    def get_frame_order(self, frame_nr, direction):
+        """
+        Returns the frame numbers to decode for a request, in the order they should be decoded.
+
+        The decoder can only read forward cheaply, so when moving backward the frames are
+        decoded in ascending blocks, starting with the block closest to the given frame.
+        """
+        if direction > 0:
+            last = min(frame_nr + self.count, self.provider.frame_count - 1)
+            return list(range(frame_nr + 1, last + 1))
+
+        block = min(self.count, self.provider.read_ahead) or 1
+        frames = []
+        end = frame_nr
+        while end > max(frame_nr - self.count, 0):
+            start = max(end - block, frame_nr - self.count, 0)
+            frames.extend(range(start, end))
+            end = start
+        return frames
+
+    def _run(self):
+        """Main loop of the worker thread."""
+        while True:
+            with self._condition:
+                while self._request is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                frame_nr, direction = self._request
+                generation = self._generation
+                self._request = None
+
+            for n in self.get_frame_order(frame_nr, direction):
+                # Stop as soon as the user has moved somewhere else
+                if self._generation != generation:
+                    break
+                if not self.provider.is_cached(n):
+                    self.provider.get_frame(n)
+
+
+class ImageBuffers:
+    """
+    Class holding preallocated images in the format used for plotting.
+
+    Frames are converted straight into one of the buffers instead of newly allocated arrays.
+    There are two buffers, so a frame never has to be written into the image currently shown by the plot.
+
+    Attributes:
+        buffers: the preallocated images, reallocated only when the size of the frames changes.
+    """
+
+    def __init__(self):
+        self.buffers = []
+
+    def get_buffer(self, shape, shown=None):
+        """Returns a buffer for an image of the given shape (height, width) which isn't the shown image."""
+
+        if not self.buffers or self.buffers[0].shape != shape:
+            self.buffers = [np.empty(shape, dtype=np.uint32) for _ in range(2)]
+        return self.buffers[1] if self.buffers[0] is shown else self.buffers[0]
+
+
+class FrameStore:
+    """
+    Class serving frames from a frame store extracted from the video ahead of time by scripts.build_frame_store.
+
+    The store is a memory-mapped array holding every frame of the video at the output size,
+    already converted into the image format used for plotting. Serving a frame costs neither
+    decoding nor copying, and the pages of the file are shared by all sessions through the OS.
+
+    Args:
+        images: memory-mapped array of shape (frames, height, width) of RGBA images packed as uint32.
+        frame_count: number of frames which were written into the store.
+    """
+
+    def __init__(self, images, frame_count):
+        self.images = images
+        self.frame_count = frame_count
+
+    def has_frame(self, frame_nr):
+        """Returns whether the store contains the given frame."""
+        return 0 <= frame_nr < self.frame_count
+
+    def get_image(self, frame_nr):
+        """Returns the image of the given frame in the format used for plotting, as a view into the store."""
+        return self.images[frame_nr]
+
+    def get_frame(self, frame_nr):
+        """Returns the given frame as a BGR frame, as it would have been decoded from the video."""
+        img = self.images[frame_nr]
+        h, w = img.shape
+        return cv2.cvtColor(
+            cv2.flip(img.view(dtype=np.uint8).reshape((h, w, 4)), 0), cv2.COLOR_RGBA2BGR
+        )
+
+
+def get_frame_store(video_path, store_path, output_size=settings.FRAME_OUTPUT_SIZE):
+    """
+    Returns the frame store of the video if one was built for its current version and the output size,
+    otherwise None. The store is opened only once per server process.
+    """
+    if video_path not in _frame_stores:
+        # Without an output size, the frames are stored at the size of the video
+        size = list(output_size) if output_size is not None else None
+        arrays = load_arrays(store_path, video_path, mmap_mode="r", size=size)
+        _frame_stores[video_path] = (
+            FrameStore(arrays["images"], int(arrays["frame_count"]))
+            if arrays is not None
+            else None
+        )
+    return _frame_stores[video_path]
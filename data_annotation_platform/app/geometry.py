@@ -0,0 +1,180 @@
+from itertools import chain
+
+import numpy as np
+
+
+class GeometryStore:
+    """
+    Class storing the points of all lines of a data source in flat arrays.
+
+    The pickled data keeps the points of every line as Python lists in the xs and ys columns,
+    which take several times the memory of the coordinates and have to be walked object by object
+    whenever a view is built. Instead, the coordinates of all lines are kept one after another in
+    two float32 arrays, and the points of a line are a slice of them given by its offsets.
+
+    Lines are looked up by the ID of their data point. New lines must have higher IDs than the lines
+    already stored, which holds for segments as their IDs are never reused. The arrays are views of
+    buffers with spare capacity, which doubles whenever it runs out, so adding a line costs amortized O(1).
+    Removed lines stay in the arrays until their points make up half of all points, the arrays are then
+    compacted at once, so removing a line costs amortized O(1) as well.
+
+    Args:
+        ids: sorted IDs of the lines.
+        offsets: position of the first point of each line in xs and ys, followed by the total number of points.
+        xs: x coordinates of all lines.
+        ys: y coordinates of all lines.
+    """
+
+    def __init__(self, ids, offsets, xs, ys):
+        self.ids = self._ids = ids
+        self.offsets = self._offsets = offsets
+        self.xs = self._xs = xs
+        self.ys = self._ys = ys
+        # Lines removed since the last compaction, and their number of points
+        self.removed_ids = []
+        self.removed_points = 0
+
+    @classmethod
+    def from_lists(cls, ids, xs, ys):
+        """Builds the store from the coordinates of every line given as lists, as in the pickled data."""
+
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        xs, ys = list(xs), list(ys)
+        xs = [xs[i] for i in order]
+        ys = [ys[i] for i in order]
+        lengths = np.fromiter(map(len, xs), dtype=np.int64, count=len(xs))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        total = int(offsets[-1])
+        return cls(
+            ids[order],
+            offsets,
+            np.fromiter(chain.from_iterable(xs), dtype=np.float32, count=total),
+            np.fromiter(chain.from_iterable(ys), dtype=np.float32, count=total),
+        )
+
+    def _positions(self, ids):
+        """Returns the positions of the lines with the given IDs."""
+        return np.searchsorted(self.ids, np.asarray(ids, dtype=np.int64))
+
+    def get_lines(self, ids):
+        """Returns the x and y coordinates of the lines with the given IDs, as lists of array slices."""
+
+        positions = self._positions(ids)
+        starts = self.offsets[positions]
+        ends = self.offsets[positions + 1]
+        xs = [self.xs[start:end] for start, end in zip(starts, ends)]
+        ys = [self.ys[start:end] for start, end in zip(starts, ends)]
+        return xs, ys
+
+    def get_points(self, ids, index):
+        """
+        Returns the x and y coordinates of the point at the given index of every line with the given IDs.
+        Negative indices count from the end of the lines.
+        """
+        positions = self._positions(ids)
+        if index >= 0:
+            points = self.offsets[positions] + index
+        else:
+            points = self.offsets[positions + 1] + index
+        return self.xs[points], self.ys[points]
+
+    def get_point(self, id, index):
+        """Returns the (x, y) point at the given index of a line, negative indices count from its end."""
+
+        xs, ys = self.get_points([id], index)
+        return float(xs[0]), float(ys[0])
+
+    def get_lines_in_polygon(self, ids, polygon_xs, polygon_ys):
+        """Returns whether every point of each line with the given IDs lies within the polygon."""
+
+        positions = self._positions(ids)
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        # Positions of the points of all lines, line after line
+        lines = np.repeat(np.arange(len(starts)), lengths)
+        points = (
+            starts[lines]
+            + np.arange(len(lines))
+            - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        )
+        inside = points_in_polygon(
+            self.xs[points], self.ys[points], polygon_xs, polygon_ys
+        )
+        return np.bincount(lines, weights=inside, minlength=len(starts)) == lengths
+
+    def add(self, ids, xs, ys):
+        """Adds lines given as lists of coordinates, with IDs higher than those of the stored lines."""
+
+        added = GeometryStore.from_lists(ids, xs, ys)
+        if len(added.ids) and len(self.ids) and added.ids[0] <= self.ids[-1]:
+            raise ValueError("Added lines must have higher IDs than the stored lines")
+        count, points = len(self.ids), len(self.xs)
+        new_count, new_points = count + len(added.ids), points + len(added.xs)
+        self._ids = _reserve(self._ids, new_count)
+        self._offsets = _reserve(self._offsets, new_count + 1)
+        self._xs = _reserve(self._xs, new_points)
+        self._ys = _reserve(self._ys, new_points)
+        self._ids[count:new_count] = added.ids
+        self._offsets[count + 1 : new_count + 1] = added.offsets[1:] + points
+        self._xs[points:new_points] = added.xs
+        self._ys[points:new_points] = added.ys
+        self.ids = self._ids[:new_count]
+        self.offsets = self._offsets[: new_count + 1]
+        self.xs = self._xs[:new_points]
+        self.ys = self._ys[:new_points]
+
+    def remove(self, ids):
+        """Removes the lines with the given IDs, compacting the arrays once enough points were removed."""
+
+        positions = self._positions(ids)
+        self.removed_ids.extend(self.ids[positions].tolist())
+        self.removed_points += int(
+            (self.offsets[positions + 1] - self.offsets[positions]).sum()
+        )
+        if self.removed_points * 2 > len(self.xs):
+            self.compact()
+
+    def compact(self):
+        """
+        Drops the points of the removed lines. The arrays are replaced instead of changed in place,
+        so copies of the store (see Segments.get_snapshot) keep their lines.
+        """
+        kept = ~np.isin(self.ids, self.removed_ids)
+        lengths = np.diff(self.offsets)
+        points = np.repeat(kept, lengths)
+        self.ids = self._ids = self.ids[kept]
+        self.offsets = self._offsets = np.concatenate([[0], np.cumsum(lengths[kept])])
+        self.xs = self._xs = self.xs[points]
+        self.ys = self._ys = self.ys[points]
+        self.removed_ids = []
+        self.removed_points = 0
+
+
+def _reserve(buffer, size):
+    """Returns the buffer if it holds the given number of values, otherwise a copy with double the capacity."""
+    if len(buffer) >= size:
+        return buffer
+    return np.resize(buffer, max(size, 2 * len(buffer)))
+
+
+def points_in_polygon(xs, ys, polygon_xs, polygon_ys):
+    """
+    Returns whether each point lies within the polygon given by its vertices, by counting the edges
+    of the polygon crossed by a ray from the point. All points are tested against one edge at a time.
+    """
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    inside = np.zeros(len(xs), dtype=bool)
+    polygon_xs = np.asarray(polygon_xs, dtype=np.float64)
+    polygon_ys = np.asarray(polygon_ys, dtype=np.float64)
+    for x0, y0, x1, y1 in zip(
+        polygon_xs,
+        polygon_ys,
+        np.roll(polygon_xs, 1),
+        np.roll(polygon_ys, 1),
+    ):
+        if y0 == y1:
+            continue
+        crosses = (y0 > ys) != (y1 > ys)
+        inside ^= crosses & (xs < x0 + (ys - y0) * (x1 - x0) / (y1 - y0))
+    return inside
@@ -1,34 +1,56 @@
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import cv2
 import numpy as np
+from bokeh.document import without_document_lock
 from bokeh.plotting import curdoc
 
 import settings
 from app.trajectories import Trajectories
 import ui.state as state
 
+# Shared by all sessions, so one session scrubbing through the video can't block the others
+executor = ThreadPoolExecutor(max_workers=settings.REFRESH_WORKERS)
+
+
+def get_image_from_frame(frame, out=None):
+    """
+    Returns the frame in a format friendly for plotting.
+    If out is given, the image is written into it instead of a newly allocated array.
+    """
 
-def get_frame_from_cap(cap, frame_nr):
-    """Returns the given frame from the video capture."""
+    h, w, _ = frame.shape
+    if out is None:
+        out = np.empty((h, w), dtype=np.uint32)
+    img = out.view(dtype=np.uint8).reshape((h, w, 4))
+    # Both conversions write into the output directly, the alpha channel is set to 255 by cvtColor
+    cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=img)
+    cv2.flip(img, 0, dst=img)
+    return out
 
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_nr)
-    _, frame = cap.read()
-    return frame
 
+def get_url_from_frame(frame, image_format, quality):
+    """Returns the frame encoded as a JPEG or WebP data URI, which the browser decodes itself."""
 
-def get_image_from_frame(frame):
-    """Returns the frame in a format friendly for plotting."""
+    params = {
+        "jpeg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+        "webp": [cv2.IMWRITE_WEBP_QUALITY, quality],
+    }
+    _, encoded = cv2.imencode(f".{image_format}", frame, params[image_format])
+    return f"data:image/{image_format};base64,{base64.b64encode(encoded).decode()}"
 
-    img = frame[::-1, :, ::-1]
 
-    h, w, _ = img.shape
+def get_plot_image(frame, frame_format, image_buffers, shown):
+    """Returns the frame in the format sent to the plot, either an RGBA image or a data URI."""
 
-    img_orig = np.zeros((h, w), dtype=np.uint32)
-    img_view = img_orig.view(dtype=np.uint8).reshape((h, w, 4))
-    img_alpha = np.zeros((h, w, 4), dtype=np.uint8)
-    img_alpha[:, :, 3] = 255
-    img_alpha[:, :, :3] = img
-    img_view[:, :, :] = img_alpha
-    return img_orig
+    if frame_format == "rgba":
+        return get_image_from_frame(
+            frame, image_buffers.get_buffer(frame.shape[:2], shown)
+        )
+    return get_url_from_frame(frame, frame_format, settings.FRAME_QUALITY)
 
 
 def clear_selected_data():
@@ -37,18 +59,122 @@ def clear_selected_data():
     state.segments.update_selected_data([], [])
 
 
+def get_loading_state():
+    """Returns the objects load_frame needs, taken from the state when the loading is requested."""
+    return dict(
+        frames=state.frames,
+        prefetcher=state.prefetcher,
+        frame_store=state.frame_store,
+        frame_format=state.plot.frame_format,
+        image_buffers=state.image_buffers,
+        shown=state.plot.get_img(),
+    )
+
+
+def load_frame(
+    frame_nr,
+    direction,
+    frames,
+    prefetcher,
+    frame_store,
+    frame_format,
+    image_buffers,
+    shown,
+):
+    """
+    Loads the image of the given frame, in the executor outside of the document lock.
+    It only uses the objects passed by get_loading_state, which are either read-only or locked.
+    The segments and trajectories change under the document lock, so their views are only built
+    once the image is shown, see show_frame.
+    """
+    if frame_store is not None and frame_store.has_frame(frame_nr):
+        # Frames in the store need no decoding, and RGBA images no conversion either
+        if frame_format == "rgba":
+            img = frame_store.get_image(frame_nr)
+        else:
+            img = get_plot_image(
+                frame_store.get_frame(frame_nr), frame_format, image_buffers, shown
+            )
+    else:
+        frame = frames.get_frame(frame_nr)
+        prefetcher.prefetch(frame_nr, direction)
+        img = get_plot_image(frame, frame_format, image_buffers, shown)
+    return img
+
+
+def show_frame(frame_nr, img):
+    """Updates the plot with an image loaded by load_frame, and the views with the data of the frame."""
+    state.plot.update_img(img)
+    state.trajectories.update_views(frame_nr)
+    state.segments.update_views(frame_nr)
+
+
+def render_frame(frame_nr):
+    """Synchronously loads and shows the given frame. Used for the initial frame of the session."""
+    state.current_frame = frame_nr
+    state.refresh_generation += 1
+    show_frame(frame_nr, load_frame(frame_nr, 0, **get_loading_state()))
+    clear_selected_data()
+
+
 def refresh_frame(attr, old, frame_nr):
     """
     A callback used in many parts of the application.
     It refreshes the currently plotted frame with the new given frame number.
+
+    Decoding and converting the frame runs in the executor, so the event loop stays
+    free for other sessions. Requests are coalesced: while a frame is loading, newer requests
+    only replace the requested frame number, and only the latest one is shown.
+
+    All frame navigation (slider, frame and minute buttons, jumps) ends up here, so this is also
+    where the direction of the user's movement is known and the following frames are prefetched.
     """
-    frame = get_frame_from_cap(state.cap, frame_nr)
-    img = get_image_from_frame(frame)
-    state.plot.update_img(img)
+    state.refresh_direction = frame_nr - state.current_frame
     state.current_frame = frame_nr
-    state.trajectories.update_views(frame_nr)
-    state.segments.update_views(frame_nr)
+    state.refresh_generation += 1
     clear_selected_data()
+    if not state.refresh_in_progress:
+        state.refresh_in_progress = True
+        doc = curdoc()
+        # The partial has to be marked itself, Bokeh doesn't see the flag of the wrapped function
+        doc.add_next_tick_callback(
+            without_document_lock(partial(refresh_latest_frame, doc))
+        )
+
+
+async def refresh_latest_frame(doc):
+    """
+    Loads the most recently requested frame in the executor and schedules showing it.
+    It runs without the document lock, so newer requests are recorded while the frame loads.
+    A frame that was superseded by another request while loading is dropped and the latest one is loaded instead.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            generation = state.refresh_generation
+            frame_nr = state.current_frame
+            img = await loop.run_in_executor(
+                executor,
+                partial(
+                    load_frame,
+                    frame_nr,
+                    state.refresh_direction,
+                    **get_loading_state(),
+                ),
+            )
+            if generation == state.refresh_generation:
+                doc.add_next_tick_callback(
+                    partial(show_latest_frame, generation, frame_nr, img)
+                )
+                break
+    finally:
+        state.refresh_in_progress = False
+
+
+def show_latest_frame(generation, frame_nr, img):
+    """Shows a loaded frame unless a newer frame was requested in the meantime."""
+    if generation == state.refresh_generation:
+        show_frame(frame_nr, img)
 
 
 def update_buttons_state():
@@ -92,8 +218,9 @@ def handle_jump_to_frame(attr, old, new):
     """
     slider = curdoc().get_model_by_name("slider")
     state.current_minute = new // 30 // 60
-    state.current_frame = new
+    # The slider refreshes the frame, which needs the previous current frame for the direction of the move
     slider.value = new
+    state.current_frame = new
     update_slider_limits()
 
 
@@ -130,3 +257,31 @@ def handle_tap(trigger):
         trigger.current_frame_view.selected.on_change("indices", handle_tap(trigger))
 
     return callback
+
+
+def handle_region_selected(event):
+    """
+    Callback for selecting a region of the plot with the box or lasso select tool.
+    It selects all segments on the current frame lying within the region, so they can be labeled at once.
+    """
+    if not event.final:
+        return
+    geometry = event.geometry
+    if geometry["type"] == "rect":
+        x0, x1, y0, y1 = (geometry[k] for k in ["x0", "x1", "y0", "y1"])
+        region = ([x0, x1, x1, x0], [y0, y0, y1, y1])
+    else:
+        region = (geometry["x"], geometry["y"])
+
+    segments = state.segments
+    view = segments.current_frame_view
+    # Temporarily remove the tap callback, which only adds one segment at a time to the selection
+    view.selected._callbacks = {}
+    clear_selected_data()
+    view_ids = np.asarray(view.data["id"])
+    selected = segments.select(ids=view_ids[view_ids >= 0], region=region)
+    indices = np.flatnonzero(np.isin(view_ids, selected))
+    segments.selected_ids = view_ids[indices].tolist()
+    view.selected.indices = indices.tolist()
+    view.selected.on_change("indices", handle_tap(segments))
+    update_buttons_state()
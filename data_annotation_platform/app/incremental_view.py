@@ -0,0 +1,143 @@
+import numpy as np
+
+
+def to_plain(value):
+    """
+    Returns the value with NumPy arrays converted to lists.
+    BokehJS doesn't decode binary arrays sent within patches and streams, only within whole data.
+    """
+    return value.tolist() if isinstance(value, np.ndarray) else value
+
+
+class IncrementalView:
+    """
+    Class updating a view (ColumnDataSource) by sending only the rows which changed to the browser.
+
+    Replacing the data of a view re-sends every row, although moving by a frame only changes a few
+    of them. Instead, the rows are identified by their "id" column, and an update only patches
+    the rows which left into holes and fills holes with the rows which entered. Rows which don't
+    fit into holes are streamed. A hole is a row with the ID -1 and no geometry, so nothing is drawn
+    for it, and tables showing the view hide it with hide_empty_rows (see ui/tables.py).
+
+    The data of the view is replaced as a whole when holes would outnumber the rows, and when
+    the view is invalidated because its rows were changed by something else than an update.
+    When the changed rows are known, apply sends them without comparing the whole data of the view.
+
+    Args:
+        source: the ColumnDataSource of the view.
+        empty_row: values of a hole for the columns which must not keep values of the previous row.
+        min_holes: number of holes always allowed before the data is replaced.
+    """
+
+    def __init__(self, source, empty_row=None, min_holes=64):
+        self.source = source
+        self.empty_row = {"id": -1, **(empty_row or {})}
+        self.min_holes = min_holes
+        self.slot_ids = np.empty(0, dtype=np.int64)
+        self.valid = False
+
+    def invalidate(self):
+        """Marks that the rows of the view were changed, so the next update replaces the data."""
+        self.valid = False
+
+    def replace(self, data):
+        """Replaces the data of the view."""
+        self.source.data = data
+        self.slot_ids = np.asarray(data["id"], dtype=np.int64)
+        self.valid = True
+
+    def update(self, data):
+        """
+        Updates the view to hold the rows in data, a dictionary of columns including "id".
+        Only rows which entered or left are sent, unless the data has to be replaced.
+        """
+        if not self.valid:
+            self.replace(data)
+            return
+
+        ids = np.asarray(data["id"], dtype=np.int64)
+        holes = self.slot_ids < 0
+        left = ~holes & ~np.isin(self.slot_ids, ids)
+        entered = np.flatnonzero(~np.isin(ids, self.slot_ids[~holes]))
+        free = np.flatnonzero(holes | left)
+        if len(free) - len(entered) > max(self.min_holes, len(ids)):
+            self.replace(data)
+            return
+
+        filled = free[: len(entered)]
+        # Free slots which aren't filled become holes, unless they were holes already
+        unfilled = free[len(filled) :]
+        self._send(
+            data,
+            filled,
+            entered[: len(filled)],
+            unfilled[left[unfilled]],
+            entered[len(filled) :],
+        )
+
+    def apply(self, data, removed):
+        """
+        Updates only the given rows of the view, without comparing it with its whole data.
+        The rows in data, a dictionary of columns including "id", are patched in place if the view holds them
+        and added otherwise, and the rows with the removed IDs become holes.
+
+        Returns False without sending anything if that would leave more holes than allowed,
+        in which case the data has to be replaced.
+        """
+        ids = np.asarray(data["id"], dtype=np.int64)
+        removed = np.setdiff1d(np.asarray(removed, dtype=np.int64), ids)
+        holes = self.slot_ids < 0
+        emptied = np.flatnonzero(~holes & np.isin(self.slot_ids, removed))
+        # Find the slots of the rows which the view already holds
+        sorter = np.argsort(self.slot_ids, kind="stable")
+        positions = np.searchsorted(self.slot_ids, ids, sorter=sorter)
+        slots = np.zeros(len(ids), dtype=np.int64)
+        held = positions < len(sorter)
+        slots[held] = sorter[positions[held]]
+        held[held] = self.slot_ids[slots[held]] == ids[held]
+        entered = np.flatnonzero(~held)
+        free = np.concatenate([np.flatnonzero(holes), emptied])
+        rows = len(self.slot_ids) - len(free) + len(entered)
+        if len(free) - len(entered) > max(self.min_holes, rows):
+            return False
+
+        filled = free[: len(entered)]
+        unfilled = free[len(filled) :]
+        self._send(
+            data,
+            np.concatenate([slots[held], filled]),
+            np.concatenate([np.flatnonzero(held), entered[: len(filled)]]),
+            unfilled[~holes[unfilled]],
+            entered[len(filled) :],
+        )
+        return True
+
+    def _send(self, data, slots, rows, emptied, streamed):
+        """
+        Patches the slots with the rows of data at the given positions, makes holes of the emptied slots
+        and streams the remaining rows.
+        """
+        patches = {}
+        if len(slots):
+            for column, values in data.items():
+                patches[column] = [
+                    (int(slot), to_plain(values[i])) for slot, i in zip(slots, rows)
+                ]
+        for column, value in self.empty_row.items():
+            patches.setdefault(column, []).extend(
+                (int(slot), value) for slot in emptied
+            )
+        if any(patches.values()):
+            self.source.patch({c: p for c, p in patches.items() if p})
+        if len(streamed):
+            self.source.stream(
+                {
+                    column: [to_plain(values[i]) for i in streamed]
+                    for column, values in data.items()
+                }
+            )
+
+        ids = np.asarray(data["id"], dtype=np.int64)
+        self.slot_ids[slots] = ids[rows]
+        self.slot_ids[emptied] = -1
+        self.slot_ids = np.concatenate([self.slot_ids, ids[streamed]])
@@ -0,0 +1,55 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+
+
+class InterestIndex:
+    """
+    Class keeping the frames with a point of interest sorted, so the next or previous one is found by bisection.
+
+    A point of interest is the first frame of a segment without a label. Every frame is kept once in a sorted
+    list, with the number of segments starting on it in a counter, so that jumping from interest to interest
+    never stops twice on the same frame. Segments update the index whenever a segment gets or loses a label,
+    or is added or removed.
+
+    Args:
+        frames: first frame of every segment without a label.
+    """
+
+    def __init__(self, frames):
+        self.counts = Counter(int(frame) for frame in frames)
+        self.frames = sorted(self.counts)
+        self.size = sum(self.counts.values())
+
+    def __len__(self):
+        return self.size
+
+    def add(self, frame):
+        """Adds a segment without a label starting on the given frame."""
+
+        frame = int(frame)
+        if not self.counts[frame]:
+            insort(self.frames, frame)
+        self.counts[frame] += 1
+        self.size += 1
+
+    def remove(self, frame):
+        """Removes a segment without a label starting on the given frame."""
+
+        frame = int(frame)
+        self.counts[frame] -= 1
+        self.size -= 1
+        if not self.counts[frame]:
+            del self.counts[frame]
+            del self.frames[bisect_left(self.frames, frame)]
+
+    def get_next(self, frame_nr, count=1):
+        """Returns the count-th frame with an interest after the given frame, None if there are fewer."""
+
+        i = bisect_right(self.frames, frame_nr) + count - 1
+        return self.frames[i] if i < len(self.frames) else None
+
+    def get_previous(self, frame_nr, count=1):
+        """Returns the count-th frame with an interest before the given frame, None if there are fewer."""
+
+        i = bisect_left(self.frames, frame_nr) - count
+        return self.frames[i] if i >= 0 else None
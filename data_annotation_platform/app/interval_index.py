@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class IntervalIndex:
+    """
+    Class finding the rows whose frame interval contains a given frame, without scanning all rows.
+
+    The intervals are grouped by their length into buckets of powers of two, and every bucket is sorted
+    by the start of its intervals. An interval in a bucket can only contain the frame if it starts
+    at most the longest length of the bucket before it, so every bucket is narrowed down to a slice
+    with two binary searches. Within the slice most intervals contain the frame, as all of them are
+    at least half as long as the longest one. A query therefore costs O(log N + k) for k results.
+
+    Rows added or removed later go into a small overlay instead of rebuilding the buckets,
+    which are only rebuilt once the overlay has grown large.
+
+    Optionally, a precomputed FrameTable serves the rows it was built from. Only rows missing
+    from the table, such as segments created later, are then kept in the buckets.
+
+    Args:
+        ids: IDs of the rows.
+        starts: first frame of the interval of each row.
+        ends: last frame of the interval of each row (inclusive).
+        overlay_size: number of added rows after which the buckets are rebuilt.
+        table: optional FrameTable built from the same intervals.
+    """
+
+    def __init__(self, ids, starts, ends, overlay_size=1024, table=None):
+        self.overlay_size = overlay_size
+        self.table = table
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        self._table_removed = set()
+        if table is not None:
+            # Rows of the table which are no longer in the data must never be returned
+            self._table_removed = set(np.setdiff1d(table.rows, ids).tolist())
+            in_table = np.isin(ids, table.rows)
+            ids, starts, ends = ids[~in_table], starts[~in_table], ends[~in_table]
+        self._build(ids, starts, ends)
+
+    def _build(self, ids, starts, ends):
+        """Builds the buckets from scratch and empties the overlay."""
+
+        self._ids, self._starts, self._ends = ids, starts, ends
+        self._buckets = []
+        lengths = ends - starts
+        buckets = np.floor(np.log2(np.maximum(lengths, 0) + 1)).astype(np.int64)
+        for bucket in np.unique(buckets):
+            rows = np.flatnonzero(buckets == bucket)
+            rows = rows[np.argsort(starts[rows], kind="stable")]
+            self._buckets.append(
+                (starts[rows], ends[rows], ids[rows], int(lengths[rows].max()))
+            )
+        self._added = []
+        self._removed = set(self._table_removed)
+
+    def query(self, frame_nr):
+        """Returns the sorted IDs of the rows whose interval contains the given frame."""
+
+        parts = [] if self.table is None else [self.table.query(frame_nr)]
+        for starts, ends, ids, max_length in self._buckets:
+            lo = np.searchsorted(starts, frame_nr - max_length, side="left")
+            hi = np.searchsorted(starts, frame_nr, side="right")
+            parts.append(ids[lo:hi][ends[lo:hi] >= frame_nr])
+        for id, start, end in self._added:
+            if start <= frame_nr <= end:
+                parts.append(np.array([id], dtype=np.int64))
+
+        result = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        if self._removed:
+            result = result[~np.isin(result, list(self._removed))]
+        return np.sort(result)
+
+    def add(self, id, start, end):
+        """Adds a row to the index."""
+
+        self._removed.discard(id)
+        self._added.append((id, start, end))
+        if len(self._added) > self.overlay_size:
+            self._rebuild()
+
+    def remove(self, id):
+        """Removes a row from the index."""
+
+        self._removed.add(id)
+        if self._in_table(id):
+            self._table_removed.add(id)
+        elif len(self._removed) - len(self._table_removed) > self.overlay_size:
+            self._rebuild()
+
+    def _in_table(self, id):
+        """Returns whether the row is served by the frame table."""
+        if self.table is None:
+            return False
+        i = np.searchsorted(self.table.rows, id)
+        return i < len(self.table.rows) and self.table.rows[i] == id
+
+    def _rebuild(self):
+        """Merges the overlay into the buckets."""
+
+        added = np.array(self._added, dtype=np.int64).reshape(-1, 3)
+        ids = np.concatenate([self._ids, added[:, 0]])
+        starts = np.concatenate([self._starts, added[:, 1]])
+        ends = np.concatenate([self._ends, added[:, 2]])
+        keep = ~np.isin(ids, list(self._removed))
+        self._build(ids[keep], starts[keep], ends[keep])
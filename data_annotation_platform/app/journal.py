@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+
+class Journal:
+    """
+    Class recording the changes an annotator makes to the segments in an append-only file.
+
+    Every operation (labeling segments, adding segments) is written as a line of JSON and flushed
+    to the disk before the call returns, so no change is lost even if the server stops. Saving the
+    whole segments data is then only needed to keep the journal short: a snapshot of the data records
+    the sequence number of the last operation it includes, and compact drops the operations up to it.
+    On startup, the operations after the snapshot are replayed on top of it (see Segments.replay).
+
+    Args:
+        path: location of the journal file, created on the first operation.
+        seq: sequence number of the last recorded operation.
+    """
+
+    def __init__(self, path, seq=0):
+        self.path = path
+        self.seq = seq
+        self.file = None
+        self.lock = threading.Lock()
+
+    def record(self, op, **fields):
+        """Appends an operation with the given fields to the journal and waits until it's on the disk."""
+
+        with self.lock:
+            if self.file is None:
+                self._open()
+            self.seq += 1
+            entry = {"seq": self.seq, "op": op, **fields}
+            self.file.write(json.dumps(entry, default=_to_json) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def _open(self):
+        """Opens the journal for appending, dropping a line which was only partly written when the server stopped."""
+
+        with open(self.path, "a+b") as file:
+            file.seek(0)
+            content = file.read()
+            if content and not content.endswith(b"\n"):
+                file.truncate(content.rfind(b"\n") + 1)
+        self.file = open(self.path, "a")
+
+    def compact(self, seq):
+        """Removes the operations up to the given sequence number, which are included in a snapshot."""
+
+        with self.lock:
+            kept = [entry for entry in read_journal(self.path) if entry["seq"] > seq]
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if not kept:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            # The journal is replaced at once, so it's never left with only a part of the operations
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as file:
+                for entry in kept:
+                    file.write(json.dumps(entry, default=_to_json) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+
+    def close(self):
+        """Closes the journal file."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_journal(path):
+    """
+    Returns the operations recorded in the journal file, an empty list if there's none.
+    A line which was only partly written when the server stopped is ignored.
+    """
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path) as file:
+        for line in file:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return entries
+
+
+def _to_json(value):
+    """Converts the NumPy values found in operations to Python values."""
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
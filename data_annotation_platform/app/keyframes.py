@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+
+from app.artifacts import load_arrays, save_arrays
+
+# Keyframe indexes by video path, shared by all sessions
+_indexes = {}
+
+
+class KeyframeIndex:
+    """
+    Class mapping frame numbers of a video to the keyframes they can be decoded from.
+
+    A frame can only be decoded by decoding everything from the previous keyframe on. Knowing where
+    the keyframes are allows seeking straight to the right keyframe and reading forward from there,
+    instead of relying on the seeking of the decoder, which can be slow and imprecise for long videos.
+
+    Args:
+        keyframes: sorted array with the frame numbers of the keyframes.
+    """
+
+    def __init__(self, keyframes):
+        self.keyframes = keyframes
+
+    def get_keyframe(self, frame_nr):
+        """Returns the frame number of the last keyframe at or before the given frame."""
+        i = np.searchsorted(self.keyframes, frame_nr, side="right") - 1
+        return int(self.keyframes[max(i, 0)])
+
+    @classmethod
+    def build(cls, video_path):
+        """
+        Builds the index by scanning the video for keyframes.
+        The video is read without decoding, so the scan is limited by the speed of the disk.
+        Returns None if the installed OpenCV can't report keyframes.
+        """
+        if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+            return None
+        cap = cv2.VideoCapture(video_path)
+        try:
+            # Return the raw packets of the stream instead of decoded frames
+            if not cap.set(cv2.CAP_PROP_FORMAT, -1):
+                return None
+            keyframes = [0]
+            frame_nr = 0
+            while cap.grab():
+                if frame_nr and cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(frame_nr)
+                frame_nr += 1
+        finally:
+            cap.release()
+        return cls(np.array(keyframes, dtype=np.int64))
+
+    @classmethod
+    def load_or_build(cls, video_path, index_path):
+        """Returns the index saved at index_path, building and saving it first if it's missing or stale."""
+        arrays = load_arrays(index_path, video_path)
+        if arrays is not None:
+            return cls(arrays["keyframes"])
+        index = cls.build(video_path)
+        if index is not None:
+            save_arrays(index_path, video_path, {"keyframes": index.keyframes})
+        return index
+
+
+def get_keyframe_index(video_path, index_path):
+    """
+    Returns the keyframe index of the video if it was built for its current version by
+    scripts.build_keyframe_index, otherwise None. The index is loaded only once per server process.
+    It's never built here, as scanning the video would block the event loop of every session.
+    """
+    if video_path not in _indexes:
+        arrays = load_arrays(index_path, video_path)
+        _indexes[video_path] = (
+            KeyframeIndex(arrays["keyframes"]) if arrays is not None else None
+        )
+    return _indexes[video_path]
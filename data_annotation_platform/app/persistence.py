@@ -0,0 +1,84 @@
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# One thread writes the snapshots of all sessions, so saving never blocks the event loop
+# and sessions saving at the same time don't compete for the disk
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+class PersistenceWorker:
+    """
+    Class saving snapshots of the segments of a session in a background thread.
+
+    A save only starts if the segments changed since the last one, which is known from their generation
+    counter, and if no other save of the session is still running. The snapshot is taken right away,
+    under the document lock, so it's consistent, but it only copies the data (see Segments.get_snapshot).
+    Converting it and writing it to the disk happens in the thread. The file is written under a temporary
+    name and then renamed, so a stopped server never leaves a partly written snapshot behind.
+    Once the snapshot is on the disk, the journal operations it includes are removed from the journal.
+    The segments and the worker only learn about the finished save on the event loop of the document.
+
+    Args:
+        path: location of the snapshot file.
+        doc: Bokeh document of the session, whose event loop records the finished saves.
+
+    Attributes:
+        saved_generation: generation of the segments in the last saved snapshot.
+        future: Future of the running or last save, None before the first one.
+    """
+
+    def __init__(self, path, doc):
+        self.path = path
+        self.doc = doc
+        self.saved_generation = 0
+        self.future = None
+
+    def save(self, segments):
+        """
+        Starts saving a snapshot of the segments. Returns the Future of the save, which results in
+        its latency in seconds and the size of the file in bytes, or None if no save was started.
+        """
+        if self.future is not None and not self.future.done():
+            return None
+        if not self.has_changes(segments):
+            return None
+
+        snapshot = segments.get_snapshot()
+        self.future = executor.submit(self._write, snapshot, segments.journal)
+        finish = partial(
+            self._finish, segments, segments.generation, snapshot.journal_seq
+        )
+        self.future.add_done_callback(
+            lambda future: self.doc.add_next_tick_callback(partial(finish, future))
+        )
+        return self.future
+
+    def has_changes(self, segments):
+        """Returns whether the segments changed since the last saved snapshot."""
+        return segments.generation != self.saved_generation
+
+    def _write(self, snapshot, journal):
+        """Writes the snapshot to the disk, in the background thread."""
+
+        start = time.perf_counter()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(snapshot.to_frame(), file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        latency = time.perf_counter() - start
+
+        if journal is not None:
+            journal.compact(snapshot.journal_seq)
+        return latency, os.path.getsize(self.path)
+
+    def _finish(self, segments, generation, journal_seq, future):
+        """Records a successful save, on the event loop."""
+
+        if future.exception() is None:
+            self.saved_generation = generation
+            segments.journal_seq = journal_seq
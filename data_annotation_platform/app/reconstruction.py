@@ -0,0 +1,236 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import settings
+from app.geometry import GeometryStore
+
+# Automatic reconstruction of trajectories broken into pieces. In every time window, the trajectories
+# ending in the window are assigned to trajectories starting after them, so that the total cost of
+# the connections is minimal. Every connection becomes a proposal segment for the annotators to review.
+
+
+def linear_sum_assignment(cost):
+    """
+    Returns the column assigned to every row of the cost matrix, minimizing the total cost.
+    The matrix must have at least as many columns as rows.
+
+    This is the shortest augmenting path form of the Hungarian algorithm with row and column potentials.
+    Each row is added with one augmenting path, and the search for the path is done for all columns
+    at once, so the work left to Python is O(rows * path length).
+    """
+    n, m = cost.shape
+    # Potentials of rows and columns, and the row assigned to every column (0 for none), all 1-based
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    assigned = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        assigned[0] = i
+        j0 = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while assigned[j0] != 0:
+            used[j0] = True
+            i0 = assigned[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(free, min_reduced[1:], np.inf))) + 1
+            delta = min_reduced[j1]
+            u[assigned[used]] += delta
+            v[used] -= delta
+            min_reduced[1:][free] -= delta
+            j0 = j1
+        # Flip the assignments along the augmenting path
+        while j0:
+            j1 = way[j0]
+            assigned[j0] = assigned[j1]
+            j0 = j1
+
+    columns = np.full(n, -1, dtype=np.int64)
+    rows = assigned[1:]
+    columns[rows[rows > 0] - 1] = np.flatnonzero(rows > 0)
+    return columns
+
+
+def get_velocities(
+    geometry, ids, index, points=settings.RECONSTRUCTION_VELOCITY_POINTS
+):
+    """
+    Returns the velocity (pixels per point) at the start (index 0) or the end (index -1) of every line,
+    estimated over its first or last few points. Lines with a single point don't move.
+    """
+    positions = np.searchsorted(geometry.ids, ids)
+    starts = geometry.offsets[positions]
+    ends = geometry.offsets[positions + 1]
+    steps = np.minimum(ends - starts - 1, points)
+    first = starts if index >= 0 else ends - 1 - steps
+    last = first + steps
+    scale = 1 / np.maximum(steps, 1)
+    return (
+        (geometry.xs[last] - geometry.xs[first]) * scale,
+        (geometry.ys[last] - geometry.ys[first]) * scale,
+    )
+
+
+def get_costs(ends, starts):
+    """
+    Returns the matrix of costs of connecting every ending trajectory to every starting trajectory.
+
+    The cost is the distance between the end and the start point, plus a cost for every frame of the gap,
+    for the change of velocity and for a change of class. Connections going back in time or over a gap
+    longer than settings.CANDIDATE_WINDOW are not possible and cost infinity.
+
+    Args:
+        ends: dictionary with the frame, x, y, velocity (vx, vy) and class at the end of every trajectory.
+        starts: dictionary with the same values at the start of every trajectory.
+    """
+
+    def pairs(name):
+        return starts[name][np.newaxis, :] - ends[name][:, np.newaxis]
+
+    gaps = pairs("frame")
+    costs = (
+        np.hypot(pairs("x"), pairs("y"))
+        + settings.CANDIDATE_FRAME_COST * gaps
+        + settings.RECONSTRUCTION_VELOCITY_COST * np.hypot(pairs("vx"), pairs("vy"))
+        + settings.RECONSTRUCTION_CLASS_COST * (pairs("class") != 0)
+    )
+    costs[(gaps < 0) | (gaps > settings.CANDIDATE_WINDOW)] = np.inf
+    return costs
+
+
+def propose_segments(
+    data,
+    geometry,
+    window_size=settings.RECONSTRUCTION_WINDOW,
+    max_cost=settings.RECONSTRUCTION_MAX_COST,
+):
+    """
+    Returns proposal segments connecting the trajectories, in the schema of the segments data.
+    They aren't created by the annotator, so like the segments of the reconstruction they are left
+    without a label to be reviewed.
+
+    The trajectories are processed in windows of their last frame. The trajectories ending in a window
+    are assigned to the trajectories starting after them, and each trajectory starts at most one connection.
+    An ending trajectory is left unconnected rather than connected at a cost of max_cost or more.
+
+    Args:
+        data: the trajectories as loaded by DataSource, without the xs and ys columns.
+        geometry: GeometryStore with the lines of the trajectories.
+    """
+    ids = data.index.values
+    values = {}
+    for name, index in [("start", 0), ("end", -1)]:
+        xs, ys = geometry.get_points(ids, index)
+        vxs, vys = get_velocities(geometry, ids, index)
+        frames = data["frame_in" if index == 0 else "frame_out"].values
+        values[name] = {
+            "frame": frames,
+            "x": xs,
+            "y": ys,
+            "vx": vxs,
+            "vy": vys,
+            "class": data["class"].values,
+        }
+
+    start_order = np.argsort(values["start"]["frame"], kind="stable")
+    start_frames = values["start"]["frame"][start_order]
+    connected = np.zeros(len(ids), dtype=bool)
+    windows = values["end"]["frame"] // window_size
+    end_order = np.argsort(windows, kind="stable")
+    bounds = np.flatnonzero(np.diff(windows[end_order])) + 1
+    sources, targets = [], []
+    for rows in np.split(end_order, bounds):
+        if not len(rows):
+            continue
+        first_frame = values["end"]["frame"][rows].min()
+        last_frame = values["end"]["frame"][rows].max() + settings.CANDIDATE_WINDOW
+        lo = np.searchsorted(start_frames, first_frame, side="left")
+        hi = np.searchsorted(start_frames, last_frame, side="right")
+        columns = start_order[lo:hi]
+        columns = columns[~connected[columns]]
+        if not len(columns):
+            continue
+
+        costs = get_costs(
+            {name: value[rows] for name, value in values["end"].items()},
+            {name: value[columns] for name, value in values["start"].items()},
+        )
+        costs[ids[rows][:, np.newaxis] == ids[columns][np.newaxis, :]] = np.inf
+        # Only trajectories with a connection cheaper than max_cost take part in the assignment
+        possible = costs < max_cost
+        rows = rows[possible.any(axis=1)]
+        costs = costs[possible.any(axis=1)][:, possible.any(axis=0)]
+        columns = columns[possible.any(axis=0)]
+        if not len(rows):
+            continue
+        # Every row may also stay unconnected at the maximum cost, which also makes the matrix wide enough
+        costs = np.hstack(
+            [np.minimum(costs, max_cost), np.full((len(rows), len(rows)), max_cost)]
+        )
+        assignment = linear_sum_assignment(costs)
+        matched = np.flatnonzero(
+            (assignment < len(columns))
+            & (costs[np.arange(len(rows)), assignment] < max_cost)
+        )
+        sources.append(rows[matched])
+        targets.append(columns[assignment[matched]])
+        connected[columns[assignment[matched]]] = True
+
+    sources = np.concatenate(sources + [np.empty(0, dtype=np.int64)])
+    targets = np.concatenate(targets + [np.empty(0, dtype=np.int64)])
+    end, start = values["end"], values["start"]
+    return pd.DataFrame(
+        {
+            "xs": [
+                [float(a), float(b)]
+                for a, b in zip(end["x"][sources], start["x"][targets])
+            ],
+            "ys": [
+                [float(a), float(b)]
+                for a, b in zip(end["y"][sources], start["y"][targets])
+            ],
+            "class": end["class"][sources],
+            "frame_in": end["frame"][sources],
+            "frame_out": start["frame"][targets],
+            "correct": None,
+            "new": False,
+            "comments": "",
+        }
+    )
+
+
+def remove_existing(proposals, segments):
+    """Returns the proposals which don't connect the same points at the same frames as one of the segments."""
+
+    keys = ["frame_in", "frame_out", "class"]
+    merged = proposals.reset_index().merge(segments[keys + ["xs", "ys"]], on=keys)
+    same = [
+        np.allclose(xs, other_xs, atol=0.5) and np.allclose(ys, other_ys, atol=0.5)
+        for xs, other_xs, ys, other_ys in zip(
+            merged["xs_x"], merged["xs_y"], merged["ys_x"], merged["ys_y"]
+        )
+    ]
+    return proposals.drop(index=merged["index"][same].unique())
+
+
+def build_proposals(trajectories_path, segments_path):
+    """Returns the proposal segments for the trajectories, leaving out those already among the segments."""
+
+    data = pd.read_pickle(trajectories_path)
+    geometry = GeometryStore.from_lists(data.index.values, data["xs"], data["ys"])
+    proposals = propose_segments(data.drop(columns=["xs", "ys"]), geometry)
+    return remove_existing(proposals, pd.read_pickle(segments_path))
+
+
+def get_proposals(proposals_path):
+    """Returns the proposal segments saved by scripts/build_proposals.py, or None if there are none."""
+
+    if not os.path.exists(proposals_path):
+        return None
+    return pd.read_pickle(proposals_path)
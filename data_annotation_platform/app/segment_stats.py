@@ -0,0 +1,75 @@
+from collections import Counter
+
+import settings
+
+
+class SegmentStats:
+    """
+    Class keeping running counts of segments, so that statistics never have to scan the data.
+
+    Segments are counted in three categories: "total" for segments created by the reconstruction algorithm,
+    "incorrect" for those of them labeled as incorrect and "new" for segments created by the annotator.
+    Every category is also counted per class and per minute of the first frame of the segments.
+    Segments update the counts whenever a segment is added, removed or labeled, in constant time.
+
+    Attributes:
+        totals: counts by category.
+        by_class: counts by (category, class).
+        by_minute: counts by (category, minute).
+    """
+
+    CATEGORIES = ["total", "incorrect", "new"]
+
+    def __init__(self):
+        self.totals = Counter()
+        self.by_class = Counter()
+        self.by_minute = Counter()
+
+    @classmethod
+    def from_data(cls, data):
+        """Returns the counts of the segments in the data."""
+
+        stats = cls()
+        stats.add_segments(data)
+        return stats
+
+    def add_segments(self, data, count=1):
+        """Counts the segments of the data in their categories, a negative count removes them."""
+
+        self.add_data("total", data[data["new"] == False], count)
+        self.add_data(
+            "incorrect",
+            data[(data["new"] == False) & (data["correct"] == False)],
+            count,
+        )
+        self.add_data("new", data[data["new"] == True], count)
+
+    def add_data(self, category, data, count=1):
+        """Counts all segments of the data in a category, a negative count removes them."""
+
+        self.totals[category] += count * len(data)
+        minutes = data["frame_in"] // settings.FRAME_INTERVAL
+        for key, n in data["class"].value_counts().items():
+            self.by_class[category, int(key)] += count * int(n)
+        for key, n in minutes.value_counts().items():
+            self.by_minute[category, int(key)] += count * int(n)
+
+    def add(self, category, class_, frame_in, count=1):
+        """Counts a segment in a category, a negative count removes it."""
+
+        self.totals[category] += count
+        self.by_class[category, int(class_)] += count
+        self.by_minute[category, int(frame_in) // settings.FRAME_INTERVAL] += count
+
+    def get_count(self, category, class_=None, minute=None):
+        """Returns the count of a category, of a single class or minute if given."""
+
+        if class_ is not None:
+            return self.by_class[category, class_]
+        if minute is not None:
+            return self.by_minute[category, minute]
+        return self.totals[category]
+
+    def get_classes(self):
+        """Returns the sorted classes of all counted segments."""
+        return sorted({class_ for (_, class_), count in self.by_class.items() if count})
@@ -1,8 +1,15 @@
+import copy
+
 import numpy as np
 import pandas as pd
 from bokeh.models import ColumnDataSource
 
+import settings
+from app.append_buffer import AppendBuffer
 from app.data_source import DataSource
+from app.incremental_view import IncrementalView
+from app.interest_index import InterestIndex
+from app.segment_stats import SegmentStats
 
 
 class Segments(DataSource):
@@ -20,10 +27,25 @@ class Segments(DataSource):
         incorrect_view: holds only segments that have the incorrect label
         correct_view: holds only segments that have the correct label
         new_view: holds only segments that have been created manually by the annotator
+        next_id: ID of the next segment to be added
+        label_views: IncrementalView of the incorrect, correct and new views
+        changed_ids: IDs of the segments added, removed or labeled since the label views were updated
+        stats: SegmentStats with the running counts of segments, kept up to date on every change
+        buffer: AppendBuffer of the segments added since the data was last merged
+        interests: InterestIndex of the first frames of the segments without a label
+        journal: Journal recording every change of the segments, None to not record them
+        journal_seq: sequence number of the last journal operation included in the loaded data
+        generation: number of changes made to the segments, used to know whether they need to be saved
+
+    Added segments go into the buffer instead of being concatenated to the data, which would copy it
+    on every added segment. The buffer is merged into the data the first time the whole data is read,
+    so data always holds all segments. Reading only some segments by ID (see get_rows), as done on
+    every refresh, doesn't merge the buffer.
     """
 
-    def __init__(self, source_path):
-        super().__init__(source_path)
+    def __init__(self, source_path, frame_table=None):
+        self.buffer = None
+        super().__init__(source_path, frame_table)
 
         # Check if the loaded data already has the annotation columns
         # This is the case when loading persisted data
@@ -32,17 +54,63 @@ class Segments(DataSource):
             self.data["new"] = False
             self.data["comments"] = ""
 
-        self._register_view("incorrect_view", self.get_segments_by_label(False))
-        self._register_view("correct_view", self.get_segments_by_label(True))
-        self._register_view("new_view", self.get_new_segments())
+        self.buffer = AppendBuffer(self.data.dtypes)
+        self.journal = None
+        # Data saved as a snapshot of a journal records the last operation it includes
+        self.journal_seq = self.data.attrs.get("journal_seq", 0)
+        self.generation = 0
+        # Saved data records the next ID as well, so the IDs of deleted segments are never reused
+        self.next_id = self.data.attrs.get(
+            "next_id", self.data.index.max() + 1 if len(self.data) else 0
+        )
+        self.stats = SegmentStats.from_data(self.data)
+        self.interests = InterestIndex(
+            self.data["frame_in"][pd.isna(self.data["correct"])]
+        )
+
+        # The views of labels don't depend on the frame, so only the segments changed since
+        # they were last updated are sent to them
+        self.label_views = {}
+        for name in ["incorrect_view", "correct_view", "new_view"]:
+            self._register_view(name, {})
+            self.label_views[name] = IncrementalView(getattr(self, name))
+            self.label_views[name].replace(
+                self.get_view_data(self.get_label_view_subset(name), lines=False)
+            )
+        self.changed_ids = set()
+
+    @property
+    def data(self):
+        """All segments, with the segments in the buffer merged into the data first."""
+        if self.buffer is not None and len(self.buffer):
+            self._data = pd.concat([self._data, self.buffer.to_frame()])
+            # For some reason concatenation resets the name of the index so it needs to be set again.
+            self._data.index.name = "id"
+            self.buffer.clear()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    def get_rows(self, ids):
+        """Returns the segments with the given IDs without merging the buffer, IDs of removed segments are ignored."""
+
+        positions = self._data.index.get_indexer(ids)
+        rows = self._data.iloc[positions[positions >= 0]]
+        if len(self.buffer):
+            rows = pd.concat([rows, self.buffer.get_rows(ids)])
+            rows.index.name = "id"
+        return rows
+
+    def get_active_data(self, frame_nr):
+        """Returns the segments shown on the given frame, looked up in the interval index."""
+        return self.get_rows(self.interval_index.query(frame_nr))
 
     def get_frame_subset(self, frame_nr):
         """Returns a subset of data relevant for the given frame. It only includes segments that are correct."""
-        return self.data[
-            (frame_nr >= self.data["frame_in"])
-            & (frame_nr <= self.data["frame_out"] + 258)
-            & (self.data["correct"] != False)
-        ]
+        subset = self.get_active_data(frame_nr)
+        return subset[subset["correct"] != False]
 
     def update_label(self, label, comments="", ids=None):
         """
@@ -56,105 +124,258 @@ class Segments(DataSource):
 
         if ids is None:
             ids = self.selected_ids
-        for id in ids:
-            is_new_segment = self.data.at[id, "new"]
-            # If the label of a newly created segment is updated it means that the segment is being deleted.
-            # It's because a newly created segment cannot be incorrect
-            if is_new_segment:
-                self.data.drop(labels=[id], axis=0, inplace=True)
-            else:
-                self.data.loc[id, ["correct", "comments"]] = np.array(
-                    [label, ",".join(comments)], dtype="object"
-                )
+        self.bulk_label(label, ",".join(comments), ids=ids)
 
-    def add_segment(self, segment):
-        """Adds a new segment to the data."""
+    def select(self, ids=None, frame_range=None, class_=None, region=None):
+        """
+        Returns the IDs of the segments matching all given conditions.
 
-        self.data = pd.concat([self.data, segment], ignore_index=True)
-        # For some reason concatenation resets the name of the index so it needs to be set again.
-        self.data.index.name = "id"
+        Attributes:
+            ids: the segments must be among these IDs
+            frame_range: (first, last) frames, inclusive, the segments must start within
+            class_: the class of the segments
+            region: (xs, ys) vertices of a polygon of the plot, every point of the segments must lie within it
+        """
 
-    def get_segments_by_label(self, label):
-        """Returns a subset of data with the given label."""
+        mask = np.ones(len(self.data), dtype=bool)
+        if ids is not None:
+            mask &= self.data.index.isin(ids)
+        if frame_range is not None:
+            first, last = frame_range
+            mask &= self.data["frame_in"].between(first, last).values
+        if class_ is not None:
+            mask &= (self.data["class"] == class_).values
+        selected = self.data.index[mask]
+        if region is not None:
+            selected = selected[
+                self.geometry.get_lines_in_polygon(selected.values, *region)
+            ]
+        return selected
+
+    def bulk_label(self, label, comments="", **conditions):
+        """
+        Updates the label of all segments matching the conditions (see select) at once.
+        Newly created segments are deleted instead, as in update_label.
+        At least one condition must be given, so all segments are never labeled by mistake.
+
+        Attributes:
+            label: one of the possible labels. True for correct, False for incorrect, None for lack of label
+            comments: comments in case of an incorrect label
+        """
 
-        return self.data[self.data["correct"] == label]
+        if all(value is None for value in conditions.values()):
+            raise ValueError(
+                "Segments to label must be selected by at least one condition"
+            )
+        selected = self.select(**conditions)
+        if self.journal is not None:
+            self.journal.record(
+                "label", ids=selected.tolist(), label=label, comments=comments
+            )
+        self.generation += 1
+        self.invalidate_views()
+        self.changed_ids.update(selected.tolist())
+        subset = self.data.loc[selected]
+        # If the label of a newly created segment is updated it means that the segment is being deleted.
+        # It's because a newly created segment cannot be incorrect
+        new = subset[subset["new"] == True]
+        labeled = subset[subset["new"] != True]
+
+        was_incorrect = labeled["correct"] == False
+        if label == False:
+            self.stats.add_data("incorrect", labeled[~was_incorrect])
+        else:
+            self.stats.add_data("incorrect", labeled[was_incorrect], -1)
+        self.data.loc[labeled.index, "correct"] = pd.Series(
+            [label] * len(labeled), index=labeled.index, dtype="object"
+        )
+        self.data.loc[labeled.index, "comments"] = comments
+        was_unlabeled = pd.isna(labeled["correct"])
+        if label is None:
+            for frame in labeled["frame_in"][~was_unlabeled]:
+                self.interests.add(frame)
+        else:
+            for frame in labeled["frame_in"][was_unlabeled]:
+                self.interests.remove(frame)
+
+        self.stats.add_segments(new, -1)
+        for frame in new["frame_in"][pd.isna(new["correct"])]:
+            self.interests.remove(frame)
+        self.data.drop(index=new.index, inplace=True)
+        self.geometry.remove(new.index.values)
+        for id in new.index:
+            self.interval_index.remove(id)
+
+    def add_segment(self, segment, ids=None):
+        """
+        Adds a new segment to the data.
 
-    def get_new_segments(self):
-        """Returns a subset of data with only segments manually created by the annotator."""
+        Attributes:
+            segment: DataFrame with the segments to add
+            ids: IDs of the segments, only given when replaying the journal. By default they get new IDs.
+        """
 
-        return self.data[self.data["new"] == True]
+        # New segments get new IDs, so IDs of existing segments never change and are never reused
+        if ids is None:
+            ids = range(self.next_id, self.next_id + len(segment))
+        segment = segment.set_axis(ids)
+        if len(segment):
+            self.next_id = max(self.next_id, int(segment.index.max()) + 1)
+        if self.journal is not None:
+            self.journal.record(
+                "add", ids=segment.index.tolist(), rows=segment.to_dict(orient="list")
+            )
+        self.geometry.add(segment.index.values, segment["xs"], segment["ys"])
+        segment = segment.drop(columns=["xs", "ys"])
+        self.buffer.append(segment)
+        self.generation += 1
+        self.invalidate_views()
+        self.changed_ids.update(segment.index)
+        self.stats.add_segments(segment)
+        for frame in segment["frame_in"][pd.isna(segment["correct"])]:
+            self.interests.add(frame)
+        for id, frame_in, frame_out in zip(
+            segment.index, segment["frame_in"], segment["frame_out"]
+        ):
+            self.interval_index.add(id, frame_in, frame_out + settings.FRAMES_AFTER_END)
+
+    def replay(self, entries):
+        """
+        Applies the operations of a journal (see app/journal.py) which aren't included in the loaded data yet.
+        The segments must not have a journal while replaying, so the operations aren't recorded again.
+        """
+        for entry in entries:
+            if entry["seq"] <= self.journal_seq:
+                continue
+            if entry["op"] == "label":
+                self.bulk_label(entry["label"], entry["comments"], ids=entry["ids"])
+            elif entry["op"] == "add":
+                # The segments keep their recorded IDs, which the following operations refer to
+                self.add_segment(pd.DataFrame(entry["rows"]), ids=entry["ids"])
+
+    def to_frame(self):
+        """Returns the data as in the loaded Pickle file, recording the last journal operation it includes and the next ID."""
+
+        data = super().to_frame()
+        data.attrs["journal_seq"] = self.journal_seq
+        data.attrs["next_id"] = int(self.next_id)
+        return data
+
+    def get_snapshot(self):
+        """
+        Returns a copy of the segments which later changes don't affect, to be saved with to_frame in another thread.
+        Only the data is copied, as lines are never changed once added. It includes every journal operation so far.
+        """
+        snapshot = copy.copy(self)
+        snapshot.buffer = None
+        snapshot.data = self.data.copy()
+        snapshot.geometry = copy.copy(self.geometry)
+        if self.journal is not None:
+            snapshot.journal_seq = self.journal.seq
+        return snapshot
 
-    def get_total_segment_count(self):
-        """Returns count of segments only created by the reconstruction algorithm. Doesn't include manually created segments by the annotator."""
-        return self.data[self.data["new"] == False].shape[0]
+    def get_segments_by_label(self, label, data=None):
+        """Returns a subset of data (all segments by default) with the given label."""
 
-    def get_correct_segment_count(self):
+        if data is None:
+            data = self.data
+        return data[data["correct"] == label]
+
+    def get_new_segments(self, data=None):
+        """Returns a subset of data (all segments by default) with only segments manually created by the annotator."""
+
+        if data is None:
+            data = self.data
+        return data[data["new"] == True]
+
+    def get_total_segment_count(self, class_=None, minute=None):
         """
-        Returns count of segments with the correct label.
+        Returns count of segments only created by the reconstruction algorithm. Doesn't include manually created segments by the annotator.
+        The count is of a single class or minute of the recording if given.
+        """
+        return self.stats.get_count("total", class_, minute)
+
+    def get_correct_segment_count(self, class_=None, minute=None):
+        """
+        Returns count of segments with the correct label, which includes segments without a label.
         Doesn't include manually created segments by the annotator as those are always correct by definition.
         """
-        return self.data[
-            (self.data["new"] == False) & (self.data["correct"] != False)
-        ].shape[0]
+        return self.get_total_segment_count(
+            class_, minute
+        ) - self.get_incorrect_segment_count(class_, minute)
 
-    def get_incorrect_segment_count(self):
+    def get_incorrect_segment_count(self, class_=None, minute=None):
         """
         Returns count of segments with the incorrect label.
         Doesn't include manually created segments by the annotator as those are always correct by definition.
         """
-        return self.data[
-            (self.data["new"] == False) & (self.data["correct"] == False)
-        ].shape[0]
+        return self.stats.get_count("incorrect", class_, minute)
 
-    def get_new_segments_count(self):
+    def get_new_segments_count(self, class_=None, minute=None):
         """Returns count of segments manually created by the annotator."""
-        return self.data[(self.data["new"] == True)].shape[0]
+        return self.stats.get_count("new", class_, minute)
 
-    def get_correct_incorrect_ratio(self):
+    def get_correct_incorrect_ratio(self, class_=None, minute=None):
         """Returns the ratio of correct to incorrect segments."""
 
-        return self.get_correct_segment_count() / self.get_total_segment_count()
+        return self.get_correct_segment_count(
+            class_, minute
+        ) / self.get_total_segment_count(class_, minute)
 
-    def get_next_interest_frame(self, frame_nr):
+    def get_next_interest_frame(self, frame_nr, count=1):
         """
-        Returns the frame number of the next frame with a point of interest relative to the current frame .
-        A point of interest is defined as a segment without a label.
+        Returns the frame number of the next frame with a point of interest relative to the current frame,
+        or of the count-th next one. A point of interest is defined as a segment without a label.
         """
-        next = self.data[
-            (self.data["frame_in"] > frame_nr) & (pd.isna(self.data["correct"]))
-        ]["frame_in"].min()
+        next = self.interests.get_next(frame_nr, count)
 
         # If there's no next interest just return the input frame
-        if np.isnan(next):
+        if next is None:
             return frame_nr
 
-        return int(next)
+        return next
+
+    def get_previous_interest_frame(self, frame_nr, count=1):
+        """Returns the frame number of the previous frame with a point of interest, or of the count-th previous one."""
+
+        previous = self.interests.get_previous(frame_nr, count)
+        return frame_nr if previous is None else previous
+
+    def get_unlabeled_segment_count(self):
+        """Returns count of segments without a label, which are left to be annotated."""
+        return len(self.interests)
 
     def get_line_style(self, subset):
-        """Returns styles for lines specific for segments."""
-
-        colors = {True: "navy", None: "red"}
-        line_style = {True: "solid", None: "dashed"}
-        line_color = [colors[i] for i in subset["correct"]]
-        line_dash = [line_style[i] for i in subset["correct"]]
-        return dict(line_color=line_color, line_dash=line_dash)
-
-    def update_views(self, frame_nr):
-        """Updates the default view and views specific for segments."""
-
-        super().update_views(frame_nr)
-        incorrect = self.get_segments_by_label(False)
-        correct = self.get_segments_by_label(True)
-        new = self.get_new_segments()
-        self.incorrect_view.data = {
-            **incorrect.to_dict(orient="list"),
-            "id": incorrect.index.values,
-        }
-        self.correct_view.data = {
-            **correct.to_dict(orient="list"),
-            "id": correct.index.values,
-        }
-        self.new_view.data = {
-            **new.to_dict(orient="list"),
-            "id": new.index.values,
-        }
+        """Returns the style of lines specific for segments, 1 for correct and 0 for not labeled segments."""
+        return dict(line_style=(subset["correct"] == True).to_numpy(np.int8))
+
+    def get_label_view_subset(self, name, data=None):
+        """Returns the segments of the data (all segments by default) which belong in the given label view."""
+
+        if name == "new_view":
+            return self.get_new_segments(data)
+        return self.get_segments_by_label(name == "correct_view", data)
+
+    def set_views_data(self, views_data):
+        """Updates the views with the data returned by get_views_data, and the label views with the changed segments."""
+
+        super().set_views_data(views_data)
+        self.update_label_views()
+
+    def update_label_views(self):
+        """
+        Sends the segments changed since the last update to the label views.
+        Segments which left a view, or were removed, are removed from it.
+        """
+        if not self.changed_ids:
+            return
+        ids = np.fromiter(self.changed_ids, dtype=np.int64)
+        self.changed_ids = set()
+        changed = self.get_rows(ids)
+        for name, view in self.label_views.items():
+            subset = self.get_label_view_subset(name, changed)
+            removed = np.setdiff1d(ids, subset.index.values)
+            if not view.apply(self.get_view_data(subset, lines=False), removed):
+                view.replace(
+                    self.get_view_data(self.get_label_view_subset(name), lines=False)
+                )
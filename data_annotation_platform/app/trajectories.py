@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
 
+from app.candidates import EndpointIndex
 from app.data_source import DataSource
+import ui.styles as styles
 
 
 class Trajectories(DataSource):
@@ -8,43 +11,52 @@ class Trajectories(DataSource):
     Class representing a data source specifically for (broken) trajectories.
     Inherits from DataSource class.
 
-    This class doesn't introduce any new attributes.
+    Args:
+        candidate_graph: Optional precomputed CandidateGraph of the trajectories.
+
+    Attributes:
+        endpoint_index: EndpointIndex of the start points of the trajectories, used to find candidates
+            of trajectories missing from the candidate graph.
     """
 
-    def __init__(self, source_path):
-        super().__init__(source_path)
+    def __init__(self, source_path, frame_table=None, candidate_graph=None):
+        super().__init__(source_path, frame_table)
+        self.candidate_graph = candidate_graph
+        ids = self.data.index.values
+        self.endpoint_index = EndpointIndex(
+            ids, self.data["frame_in"].values, *self.geometry.get_points(ids, 0)
+        )
 
     def get_frame_subset(self, frame_nr):
         """Returns a subset of data relevant for the given frame."""
 
-        return self.data[
-            (frame_nr >= self.data["frame_in"])
-            & (frame_nr <= self.data["frame_out"] + 258)
-        ]
+        return self.get_active_data(frame_nr)
 
     def get_candidates(self, traj_id):
         """
-        Returns a subset of trajectories that are a good candidate for the trajectory with the given ID.
-        The only factor considered in the evaluation of candidates is time.
-        Only trajectories that start within 900 frames are considered candidates.
+        Returns the trajectory with the given ID followed by the best candidates for continuing it,
+        from the best to the worst. Candidates start shortly after the trajectory ends, near its end point.
         """
 
-        t1 = self.data.iloc[traj_id]
-        return self.data[
-            (self.data.index == traj_id)
-            | (self.data["frame_in"] >= t1["frame_out"])
-            & (self.data["frame_out"] <= t1["frame_out"] + 900)
-        ]
+        found = None
+        if self.candidate_graph is not None:
+            found = self.candidate_graph.get_candidates(traj_id)
+        if found is None:
+            t1 = self.data.loc[traj_id]
+            x, y = self.geometry.get_point(traj_id, -1)
+            found = self.endpoint_index.query(t1["frame_out"], x, y)
+        ids = found[0][found[0] != traj_id]
+        return self.data.loc[np.concatenate([[traj_id], ids])]
 
     def show_candidates(self, traj_id):
         """Updates the current frame view with candidate trajectories."""
 
         subset = self.get_candidates(traj_id)
-        line_colors = ["brown" for _ in subset["class"]]
+        line_style = np.full(len(subset), styles.CANDIDATE_STYLE, dtype=np.int8)
         # Keep the selected trajectory's color green
-        line_colors[0] = "green"
+        line_style[0] = styles.SELECTED_STYLE
+        self.invalidate_views()
         self.current_frame_view.data = {
-            **subset.to_dict(orient="list"),
-            "id": subset.index.values,
-            "line_color": line_colors,
+            **self.get_view_data(subset),
+            "line_style": line_style,
         }
@@ -3,6 +3,10 @@ import uuid
 
 import settings
 import ui.state as state
+from app.frame_table import get_frame_table
+from app.journal import Journal, read_journal
+from app.reconstruction import get_proposals
+from app.segments import Segments
 
 # app_hooks.py is a special file in Bokeh that allows triggering callbacks
 # at specific points of the application lifecycle
@@ -12,6 +16,9 @@ def on_session_created(session_context):
     """
     Checks for a session cookie in the user's browser.
     If the cookie exists, load the relevant user data. Otherwise start a new session.
+
+    The data of a user is the last saved snapshot, if any, and the journal of the changes made since,
+    which is replayed on top of it (see load_segments).
     """
 
     if "uid" in session_context.request._cookies:
@@ -21,6 +28,36 @@ def on_session_created(session_context):
         path = f"{settings.project_path}/data/{filename}"
         if os.path.exists(path):
             settings.segments_path = path
+        else:
+            # The user has no snapshot yet, but may have a journal of changes to the default segments
+            settings.segments_path = settings.default_segments_path
     else:
         state.uid = str(uuid.uuid4())
-        settings.segments_path = f"{settings.project_path}/data/segments.pkl"
+        settings.segments_path = settings.default_segments_path
+    load_segments(f"{settings.project_path}/data/{state.uid}.journal")
+
+
+def load_segments(journal_path):
+    """
+    Loads the segments of the session into the state, applies the changes recorded in the journal
+    since they were saved and starts recording the following ones.
+    """
+
+    segments_table = None
+    if settings.USE_FRAME_TABLES:
+        # Segments loaded from the saved progress of a user still consist of the original segments
+        # and keep their IDs, so the table of the original segments serves them as well
+        segments_table = get_frame_table(
+            settings.default_segments_path, settings.segments_frame_table_path
+        )
+    state.segments = Segments(settings.segments_path, segments_table)
+    if settings.segments_path == settings.default_segments_path:
+        # New sessions start with the proposals of the automatic reconstruction, if there are any
+        proposals = get_proposals(settings.proposals_path)
+        if proposals is not None:
+            state.segments.add_segment(proposals)
+
+    entries = read_journal(journal_path)
+    state.segments.replay(entries)
+    seqs = [state.segments.journal_seq] + [entry["seq"] for entry in entries]
+    state.segments.journal = Journal(journal_path, seq=max(seqs))
@@ -1,16 +1,21 @@
 import cv2
+from bokeh.events import SelectionGeometry
 from bokeh.layouts import column, row
 from bokeh.plotting import curdoc
 
 import settings
 import ui.state as state
-from app.helpers import handle_tap, refresh_frame
-from app.segments import Segments
+from app.candidates import get_candidate_graph
+from app.decoder_pool import get_decoder_pool
+from app.frame_table import get_frame_table
+from app.frames import FramePrefetcher, FrameProvider, ImageBuffers, get_frame_store
+from app.helpers import handle_region_selected, handle_tap, render_frame
+from app.keyframes import get_keyframe_index
 from app.trajectories import Trajectories
 from ui.data_export import create_download_btn
 from ui.labeling import create_labeling_controls
 from ui.navigation import create_navigation
-from ui.session import create_save_progress_btn
+from ui.session import close_on_session_destroyed, create_save_progress_btn
 from ui.slider import create_slider
 from ui.tables import create_tabs
 from ui.trajectory_plot import TrajectoryPlot
@@ -19,26 +24,59 @@ from ui.trajectory_plot import TrajectoryPlot
 def initialize_state():
     """Initializes the state of the application."""
 
-    state.segments = Segments(settings.segments_path)
+    # The segments are loaded when the session is created, see app_hooks.py
+    trajectories_table = None
+    if settings.USE_FRAME_TABLES:
+        trajectories_table = get_frame_table(
+            settings.trajectories_path, settings.trajectories_frame_table_path
+        )
     state.segments.current_frame_view.selected.on_change(
         "indices", handle_tap(state.segments)
     )
-    state.trajectories = Trajectories(settings.trajectories_path)
+    candidate_graph = get_candidate_graph(
+        settings.trajectories_path, settings.candidate_graph_path
+    )
+    state.trajectories = Trajectories(
+        settings.trajectories_path, trajectories_table, candidate_graph
+    )
     state.trajectories.current_frame_view.selected.on_change(
         "indices", handle_tap(state.trajectories)
     )
     state.current_frame = 0
+    state.refresh_generation = 0
+    state.refresh_direction = 0
+    state.refresh_in_progress = False
     state.current_minute = 0
-    state.cap = cv2.VideoCapture(settings.video_path)
-    state.total_frames = int(state.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    state.plot = TrajectoryPlot(state.trajectories, state.segments)
-    refresh_frame("", 1, 1)
+    keyframes = get_keyframe_index(settings.video_path, settings.keyframe_index_path)
+    if settings.DECODER_WORKERS:
+        # The pool decodes for all sessions, the session doesn't open the video itself
+        state.frames = get_decoder_pool(
+            settings.video_path, settings.keyframe_index_path
+        )
+    else:
+        state.frames = FrameProvider(
+            cv2.VideoCapture(settings.video_path), keyframes=keyframes
+        )
+    state.total_frames = state.frames.frame_count
+    state.prefetcher = FramePrefetcher(state.frames)
+    # The decoder pool is shared by all sessions, only a decoder of the session itself is closed
+    session_frames = [] if settings.DECODER_WORKERS else [state.frames]
+    close_on_session_destroyed(
+        state.prefetcher, *session_frames, state.segments.journal
+    )
+    state.image_buffers = ImageBuffers()
+    state.frame_store = get_frame_store(settings.video_path, settings.frame_store_path)
+    state.plot = TrajectoryPlot(
+        state.trajectories, state.segments, frame_format=settings.FRAME_FORMAT
+    )
+    state.plot.plot.on_event(SelectionGeometry, handle_region_selected)
+    render_frame(1)
 
 
 initialize_state()
 
 # == Create and add all UI components ==
-save_btn = create_save_progress_btn()
+save_controls = create_save_progress_btn()
 download_btn = create_download_btn()
 slider_row = row(create_slider())
 jump_to, *btns = create_navigation()
@@ -46,7 +84,7 @@ navigation_btns = row(*btns)
 navigation = column(slider_row, jump_to, navigation_btns)
 table_tabs = column(*create_tabs())
 labeling_controls = column(
-    table_tabs, *create_labeling_controls(), save_btn, download_btn
+    table_tabs, *create_labeling_controls(), *save_controls, download_btn
 )
 curdoc().add_root(row(state.plot.plot, labeling_controls))
 curdoc().add_root(navigation)
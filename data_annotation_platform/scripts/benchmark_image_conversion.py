@@ -0,0 +1,65 @@
+import argparse
+import timeit
+
+import numpy as np
+
+from app.frames import ImageBuffers
+from app.helpers import get_image_from_frame
+
+# Micro-benchmark of the conversion of decoded frames into images for plotting.
+# Run from the data_annotation_platform directory:
+#   python -m scripts.benchmark_image_conversion
+
+
+def get_image_from_frame_legacy(frame):
+    """The previous conversion, which allocates new arrays and copies twice per frame."""
+
+    img = frame[::-1, :, ::-1]
+
+    h, w, _ = img.shape
+
+    img_orig = np.zeros((h, w), dtype=np.uint32)
+    img_view = img_orig.view(dtype=np.uint8).reshape((h, w, 4))
+    img_alpha = np.zeros((h, w, 4), dtype=np.uint8)
+    img_alpha[:, :, 3] = 255
+    img_alpha[:, :, :3] = img
+    img_view[:, :, :] = img_alpha
+    return img_orig
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the conversion of frames into images for plotting."
+    )
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    buffers = ImageBuffers()
+    shown = None
+
+    def convert_into_buffer():
+        nonlocal shown
+        shown = get_image_from_frame(frame, buffers.get_buffer(frame.shape[:2], shown))
+
+    # Make sure both conversions produce the same image before timing them
+    assert np.array_equal(
+        get_image_from_frame_legacy(frame), get_image_from_frame(frame)
+    )
+
+    benchmarks = {
+        "legacy": lambda: get_image_from_frame_legacy(frame),
+        "allocating": lambda: get_image_from_frame(frame),
+        "buffered": convert_into_buffer,
+    }
+    print(f"{args.width}x{args.height}, {args.number} frames")
+    for name, func in benchmarks.items():
+        seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+        print(f"{name:>12}: {seconds / args.number * 1000:.3f} ms per frame")
+
+
+if __name__ == "__main__":
+    main()
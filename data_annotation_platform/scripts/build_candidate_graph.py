@@ -0,0 +1,28 @@
+import numpy as np
+
+import settings
+from app.candidates import CandidateGraph
+
+# Precomputes the ranked candidates of every trajectory with a process pool over all cores,
+# so that showing the candidates of a trajectory is a lookup. The graph is only used while it matches
+# the trajectories and the candidate settings, and has to be rebuilt when either changes.
+# Run from the data_annotation_platform directory:
+#   python -m scripts.build_candidate_graph
+
+
+def main():
+    graph = CandidateGraph.build_and_save(
+        settings.trajectories_path, settings.candidate_graph_path
+    )
+    counts = np.diff(graph.offsets)
+    best = graph.scores[graph.offsets[:-1][counts > 0]]
+    print(
+        f"{settings.candidate_graph_path}: {len(graph.rows)} trajectories, {len(graph.ids)} candidates"
+    )
+    print(f"Trajectories without candidates: {np.count_nonzero(counts == 0)}")
+    if len(best):
+        print(f"Median score of the best candidate: {np.median(best):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+
+import cv2
+import numpy as np
+
+import settings
+from app.artifacts import save_description
+from app.frames import FrameProvider
+from app.helpers import get_image_from_frame
+
+# Extracts every frame of the video into a memory-mapped frame store, which the platform then
+# serves frames from without decoding. The frames are stored at settings.FRAME_OUTPUT_SIZE
+# (at the size of the video if it's None),
+# so the store has to be rebuilt when the output size or the video changes.
+# Run from the data_annotation_platform directory:
+#   python -m scripts.build_frame_store
+
+
+def main():
+    path = settings.frame_store_path
+    # Remove the description first so an interrupted build never leaves a store that looks valid
+    if os.path.exists(f"{path}.json"):
+        os.remove(f"{path}.json")
+
+    frames = FrameProvider(cv2.VideoCapture(settings.video_path), cache_size=0)
+    first = frames.get_frame(0)
+    h, w, _ = first.shape
+    images = np.lib.format.open_memmap(
+        f"{path}.images.npy",
+        mode="w+",
+        dtype=np.uint32,
+        shape=(frames.frame_count, h, w),
+    )
+    print(
+        f"Extracting {frames.frame_count} frames of {w}x{h} ({images.nbytes / 1024**3:.1f} GB)"
+    )
+
+    frame_count = 0
+    for frame_nr in range(frames.frame_count):
+        frame = frames.get_frame(frame_nr)
+        # The frame count reported by the container can be off, stop at the first missing frame
+        if frame is None:
+            break
+        get_image_from_frame(frame, images[frame_nr])
+        frame_count += 1
+        if frame_count % 1000 == 0:
+            print(f"{frame_count} frames extracted")
+    images.flush()
+    del images
+
+    np.save(f"{path}.frame_count.npy", np.array(frame_count))
+    output_size = settings.FRAME_OUTPUT_SIZE
+    size = list(output_size) if output_size is not None else None
+    save_description(
+        path,
+        settings.video_path,
+        ["images", "frame_count"],
+        size=size,
+    )
+    print(f"{frame_count} frames stored in {path}.images.npy")
+
+
+if __name__ == "__main__":
+    main()
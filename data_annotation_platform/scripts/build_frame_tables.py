@@ -0,0 +1,23 @@
+import settings
+from app.frame_table import FrameTable
+
+# Builds the frame tables of the datasets ahead of time, so that the first session doesn't have to.
+# The tables are only used with settings.USE_FRAME_TABLES enabled.
+# Run from the data_annotation_platform directory:
+#   python -m scripts.build_frame_tables
+
+
+def main():
+    for source_path, table_path in [
+        (settings.trajectories_path, settings.trajectories_frame_table_path),
+        (settings.default_segments_path, settings.segments_frame_table_path),
+    ]:
+        table = FrameTable.load_or_build(source_path, table_path)
+        print(
+            f"{table_path}: {len(table.rows)} rows, {len(table.offsets) - 1} frames, "
+            f"{len(table.ids)} entries"
+        )
+
+
+if __name__ == "__main__":
+    main()
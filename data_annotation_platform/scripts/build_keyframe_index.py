@@ -0,0 +1,23 @@
+import settings
+from app.keyframes import KeyframeIndex
+
+# Builds the keyframe index of the video ahead of time. The platform only loads it, without an index
+# frames are reached by seeking and reading ahead instead.
+# Run from the data_annotation_platform directory:
+#   python -m scripts.build_keyframe_index
+
+
+def main():
+    index = KeyframeIndex.load_or_build(
+        settings.video_path, settings.keyframe_index_path
+    )
+    if index is None:
+        print("The installed OpenCV can't report keyframes, no index was built.")
+    else:
+        print(
+            f"{len(index.keyframes)} keyframes indexed in {settings.keyframe_index_path}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import time
+
+import settings
+from app.reconstruction import build_proposals
+
+# Reconstructs the broken trajectories automatically and saves the connections as proposal segments,
+# which are added to the segments of every new session for the annotators to review.
+# Sessions already started keep their segments. Delete the file to stop proposing segments.
+# Run from the data_annotation_platform directory:
+#   python -m scripts.build_proposals
+
+
+def main():
+    start = time.perf_counter()
+    proposals = build_proposals(
+        settings.trajectories_path, settings.default_segments_path
+    )
+    proposals.to_pickle(settings.proposals_path)
+    print(
+        f"{settings.proposals_path}: {len(proposals)} proposal segments "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
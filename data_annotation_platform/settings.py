@@ -4,7 +4,59 @@ import pathlib
 # This allows to control settings that apply to the entire application from one place
 
 project_path = pathlib.Path(__file__).parent.absolute()
-segments_path = f"{project_path}/data/segments.pkl"
+default_segments_path = f"{project_path}/data/segments.pkl"
+segments_path = default_segments_path
 trajectories_path = f"{project_path}/data/broken_trajectories.pkl"
+# Precomputed frame tables of the datasets, used when USE_FRAME_TABLES is enabled
+USE_FRAME_TABLES = False
+segments_frame_table_path = f"{project_path}/data/segments_frames"
+trajectories_frame_table_path = f"{project_path}/data/broken_trajectories_frames"
 FRAME_INTERVAL = 1800
+# Number of frames for which trajectories and segments are still shown after their last frame
+FRAMES_AFTER_END = 258
+# Candidates suggested for continuing a selected trajectory
+# They start at most CANDIDATE_WINDOW frames after the end of the trajectory and are ranked by
+# their distance in pixels plus CANDIDATE_FRAME_COST pixels for every frame of gap
+CANDIDATE_WINDOW = 900
+CANDIDATE_COUNT = 10
+CANDIDATE_FRAME_COST = 0.1
+# Precomputed candidates of all trajectories, used if built for the current trajectories and settings
+candidate_graph_path = f"{project_path}/data/broken_trajectories_candidates"
+# Automatic reconstruction, see app/reconstruction.py
+# Proposal segments saved by scripts/build_proposals.py are added to the segments of new sessions
+proposals_path = f"{project_path}/data/proposals.pkl"
+# Trajectories ending within a window of this many frames are connected together
+RECONSTRUCTION_WINDOW = 300
+# Number of points over which the velocity of a line is estimated
+RECONSTRUCTION_VELOCITY_POINTS = 5
+# Costs of a connection, in pixels of distance, per pixel/point of velocity change and for a change of class
+RECONSTRUCTION_VELOCITY_COST = 10
+RECONSTRUCTION_CLASS_COST = 50
+# Connections costing more are not proposed
+RECONSTRUCTION_MAX_COST = 100
+# Changes are recorded in a journal per user, which is compacted into a snapshot this often (milliseconds)
+JOURNAL_COMPACTION_INTERVAL = 5 * 60 * 1000
 video_path = f"{project_path}/video/video.mp4"
+keyframe_index_path = f"{project_path}/video/video_index"
+frame_store_path = f"{project_path}/video/video_frames"
+
+# Decoded video frames
+# Every session has its own cache, it holds the prefetched frames at the output size and a few more
+FRAME_CACHE_SIZE = 192 * 1024**2  # bytes
+FRAME_READ_AHEAD = 90  # frames to read forward instead of seeking
+# Larger frames are downscaled to fit within this (width, height) before plotting, it matches the plot size
+FRAME_OUTPUT_SIZE = (1280, 720)
+# Format frames are sent to the browser in: "rgba" (raw), "jpeg" or "webp", and the quality of encoded frames
+FRAME_FORMAT = "rgba"
+FRAME_QUALITY = 80
+PREFETCH_FRAMES = 60  # frames decoded ahead in the direction of navigation
+REFRESH_WORKERS = 4  # threads loading frames for all sessions
+# Decoder processes shared by all sessions, 0 to decode in every session separately
+DECODER_WORKERS = 0
+# Sessions served by the decoders at the same time, every one of them prefetches PREFETCH_FRAMES frames
+DECODER_SESSIONS = 4
+# Decoded frames held in shared memory, enough for the prefetched frames of all sessions
+DECODER_SLOTS = DECODER_SESSIONS * (PREFETCH_FRAMES + 4)
+# Seconds to wait for a decoder process before decoding the frame in the server process
+DECODER_TIMEOUT = 2
+DECODER_BLOCK = 300  # consecutive frames decoded by the same process
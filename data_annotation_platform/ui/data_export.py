@@ -9,7 +9,7 @@ def create_download_btn():
     """Returns a button widget for downloading the annotated dataset in a csv format."""
 
     dl_button = Button(label="Download")
-    source = ColumnDataSource(state.segments.data)
+    source = ColumnDataSource(state.segments.to_frame())
     dl_button.js_on_event(
         "button_click",
         CustomJS(
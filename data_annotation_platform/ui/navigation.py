@@ -1,3 +1,4 @@
+import numpy as np
 from bokeh.models import Button, NumericInput
 
 from app.helpers import handle_jump_to_frame
@@ -15,15 +16,32 @@ def handle_frame_navigation(value):
     return callback
 
 
-def handle_next_interest():
-    """Callback for jumping to frame with the next point of interest."""
+def handle_interest_navigation(direction, count_input):
+    """
+    Callback generator for jumping to the frame with a point of interest.
+    It jumps forward for a positive direction and backward for a negative one, by as many interests
+    as given in the count input.
 
-    frame_ins = state.segments.current_frame_view.data["frame_in"]
-    # Find the segment with the latest frame_in in the current frame view
-    max_frame = int(max(frame_ins)) if frame_ins else state.current_frame
-    # Find the next not annotated segment with frame_in after max_frame
-    next_frame = state.segments.get_next_interest_frame(max_frame)
-    handle_jump_to_frame("", 0, next_frame)
+    Segments shown on the current frame are skipped: the next interest is searched after the latest
+    first frame of the shown segments, and the previous one before the earliest.
+    """
+
+    def callback():
+        view = state.segments.current_frame_view.data
+        # Skip the empty rows left in the view by incremental updates
+        frame_ins = np.asarray(view["frame_in"])[np.asarray(view["id"]) >= 0]
+        count = count_input.value or 1
+        if direction > 0:
+            start = int(frame_ins.max()) if len(frame_ins) else state.current_frame
+            frame = state.segments.get_next_interest_frame(start, count)
+        else:
+            start = int(frame_ins.min()) if len(frame_ins) else state.current_frame
+            frame = state.segments.get_previous_interest_frame(start, count)
+        # Without an interest to jump to, stay on the current frame
+        if frame != start:
+            handle_jump_to_frame("", 0, frame)
+
+    return callback
 
 
 def create_navigation():
@@ -51,10 +69,17 @@ def create_navigation():
         btn.on_click(handle_frame_navigation(frames))
         btns.append(btn)
 
-    # == Next interest button ==
-    next_interest = Button(
-        label="Jump to next interest", height=styles.NAV_BTN_SIZE, width_policy="min"
+    # == Interest navigation buttons ==
+    # Number of interests the buttons jump over at once
+    interest_count = NumericInput(
+        value=1, low=1, title="Interests to jump", width=styles.NAV_BTN_SIZE * 2
     )
-    next_interest.on_click(handle_next_interest)
+    # Define the interest navigation buttons in format {direction: label}
+    interest_labels = {-1: "Jump to previous interest", 1: "Jump to next interest"}
+    for direction, label in interest_labels.items():
+        btn = Button(label=label, height=styles.NAV_BTN_SIZE, width_policy="min")
+        btn.on_click(handle_interest_navigation(direction, interest_count))
+        btns.append(btn)
+    btns.append(interest_count)
 
-    return [jump_to, *btns, next_interest]
+    return [jump_to, *btns]
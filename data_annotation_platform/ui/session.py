@@ -1,12 +1,19 @@
+from functools import partial
+
 import settings
-from bokeh.models import Button, CustomJS
+from bokeh.events import DocumentReady
+from bokeh.models import Button, CustomJS, Paragraph
 from bokeh.plotting import curdoc
 
+from app.persistence import PersistenceWorker
 import ui.state as state
 
 
 def create_save_progress_btn():
-    """Returns button for saving progress and add automatic periodic save."""
+    """
+    Returns button for saving progress and add automatic periodic save, followed by the status of the last save.
+    Saving writes a snapshot of the segments in the background and removes the operations it includes from the journal.
+    """
 
     # JavaScript callback to save a cookie in the user's browser
     store_cookie = CustomJS(
@@ -16,18 +23,61 @@ def create_save_progress_btn():
         """,
     )
 
-    def save():
+    def store_cookie_in_browser(*args):
         save_btn.name = f"{save_btn.name}1"
-        # Save the data on the server
-        state.segments.export_data(f"{settings.project_path}/data/{state.uid}")
+
+    def show_save_status(future):
+        """Shows how long the save took and how large the snapshot is, or why it failed."""
+        if future.exception() is not None:
+            save_status.text = f"Saving failed: {future.exception()}"
+        else:
+            latency, size = future.result()
+            save_status.text = f"Saved in {latency:.2f} s ({size / 1024**2:.1f} MB)"
+
+    def save_now():
+        """Saves on a click of the button, which also tells when there's nothing new to save."""
+        if not worker.has_changes(state.segments):
+            save_status.text = "Nothing to save"
+        save()
+
+    def save():
+        store_cookie_in_browser()
+        # Every change is already in the journal, a snapshot is only saved to keep the journal short
+        future = worker.save(state.segments)
+        if future is not None:
+            # The save finishes in another thread, the status is updated under the document lock
+            future.add_done_callback(
+                lambda future: doc.add_next_tick_callback(
+                    partial(show_save_status, future)
+                )
+            )
+
+    doc = curdoc()
+    worker = PersistenceWorker(f"{settings.project_path}/data/{state.uid}.pkl", doc)
+    save_status = Paragraph(text="")
 
     save_btn = Button(label="Save progress", margin=(100, 0, 0, 0))
-    save_btn.on_click(save)
+    save_btn.on_click(save_now)
 
     # Bokeh doesn't allow for arbitrary JS exectution, it can only be done via a callback
     # As a workaround, the button's name property will be updated to trigger the callback
     save_btn.js_on_change("name", store_cookie)
+    # Changes are journaled from the first one, so the cookie is also stored as soon as the page loads
+    curdoc().on_event(DocumentReady, store_cookie_in_browser)
+
+    # Automatic saves, which compact the journal into a snapshot
+    curdoc().add_periodic_callback(save, settings.JOURNAL_COMPACTION_INTERVAL)
+    return [save_btn, save_status]
+
+
+def close_on_session_destroyed(*resources):
+    """
+    Closes the given resources of the session once it's destroyed, in the given order.
+    Sessions are destroyed shortly after their browser tab is closed, see the server's unused session lifetime.
+    """
+
+    def close(session_context):
+        for resource in resources:
+            resource.close()
 
-    # Automatic saves every minute
-    curdoc().add_periodic_callback(save, 60000)
-    return save_btn
+    curdoc().on_session_destroyed(close)
@@ -1,5 +1,4 @@
-import cv2
-
+from app.frames import FramePrefetcher, FrameProvider, FrameStore, ImageBuffers
 from app.segments import Segments
 from app.trajectories import Trajectories
 from ui.trajectory_plot import TrajectoryPlot
@@ -10,8 +9,14 @@ from ui.trajectory_plot import TrajectoryPlot
 segments: Segments
 trajectories: Trajectories
 current_frame: int
+refresh_generation: int
+refresh_direction: int
+refresh_in_progress: bool
 current_minute: int
 total_frames: int
 uid: str
-cap: cv2.VideoCapture
+frames: FrameProvider
+prefetcher: FramePrefetcher
+image_buffers: ImageBuffers
+frame_store: FrameStore
 plot: TrajectoryPlot
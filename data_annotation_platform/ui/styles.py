@@ -8,3 +8,23 @@ NAV_BTN_SIZE = 75
 SLIDER_WIDTH = PLOT_WIDTH - 150
 TABLE_HEIGHT = 250
 TABLE_WIDTH = 550
+
+# Line colors of trajectories by class
+CLASS_COLORS = [
+    "red",
+    "magenta",
+    "green",
+    "orange",
+    "cyan",
+    "yellow",
+    "blue",
+    "black",
+    "navy",
+]
+# Line styles of trajectories which aren't given by their class, following the classes
+CANDIDATE_STYLE = len(CLASS_COLORS)
+SELECTED_STYLE = len(CLASS_COLORS) + 1
+TRAJECTORY_COLORS = CLASS_COLORS + ["brown", "green"]
+# Line colors and dashes of segments by label, 0 for not labeled and 1 for correct segments
+SEGMENT_COLORS = ["red", "navy"]
+SEGMENT_DASHES = ["dashed", "solid"]
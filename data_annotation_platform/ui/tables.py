@@ -1,6 +1,15 @@
 from textwrap import dedent
 
-from bokeh.models import DataTable, Panel, Paragraph, PreText, TableColumn, Tabs
+from bokeh.models import (
+    CDSView,
+    CustomJSFilter,
+    DataTable,
+    Panel,
+    Paragraph,
+    PreText,
+    TableColumn,
+    Tabs,
+)
 from bokeh.plotting import curdoc
 
 from app.helpers import handle_jump_to_frame
@@ -16,7 +25,7 @@ def handle_table_row_clicked(table):
 
     def callback(attr, old, new):
         if new:
-            frame = table.source.data["frame_in"][new[0]]
+            frame = int(table.source.data["frame_in"][new[0]])
             handle_jump_to_frame("", 0, frame)
 
     return callback
@@ -31,19 +40,53 @@ def clear_selections(table):
     return callback
 
 
+def hide_empty_rows(source):
+    """
+    Returns a view of the source without the empty rows (ID -1) left behind by incremental updates.
+    The filtering runs in the browser, so it needs no data from the server.
+    """
+
+    return CDSView(
+        source=source,
+        filters=[
+            CustomJSFilter(
+                code="""
+                    const ids = source.data["id"]
+                    const indices = []
+                    for (let i = 0; i < ids.length; i++) {
+                        if (ids[i] >= 0) indices.push(i)
+                    }
+                    return indices
+                """
+            )
+        ],
+    )
+
+
 def create_tabs():
     """Returns the panel widget with tabs for different tables."""
 
     def update_stats():
-        """Updates the statistics text."""
-
-        stats.text = dedent(
-            f"""
-                Number of correct segments: {state.segments.get_correct_segment_count()}
-                Number of incorrect segments: {state.segments.get_incorrect_segment_count()}
-                Number of new segments: {state.segments.get_new_segments_count()}
-                Accuracy: {"{:.2f}".format(state.segments.get_correct_incorrect_ratio() * 100)}%
+        """Updates the statistics text from the running counts of the segments."""
+
+        segments = state.segments
+        lines = [
+            f"Class {class_}: {segments.get_correct_segment_count(class_)} correct, "
+            f"{segments.get_incorrect_segment_count(class_)} incorrect, "
+            f"{segments.get_new_segments_count(class_)} new"
+            for class_ in segments.stats.get_classes()
+        ]
+        stats.text = (
+            dedent(
+                f"""
+                Number of correct segments: {segments.get_correct_segment_count()}
+                Number of incorrect segments: {segments.get_incorrect_segment_count()}
+                Number of new segments: {segments.get_new_segments_count()}
+                Number of segments left to label: {segments.get_unlabeled_segment_count()}
+                Accuracy: {"{:.2f}".format(segments.get_correct_incorrect_ratio() * 100)}%
             """
+            )
+            + "\n".join(lines)
         )
 
     def handle_tab_switched(attr, old, new):
@@ -78,12 +121,15 @@ def create_tabs():
 
     # == Table for trajectories on current frame ==
     trajectories_table = DataTable(
-        source=state.trajectories.current_frame_view, **table_settings
+        source=state.trajectories.current_frame_view,
+        view=hide_empty_rows(state.trajectories.current_frame_view),
+        **table_settings,
     )
 
     # == Table for incorrect segments ==
     incorrect_segments_table = DataTable(
         source=state.segments.incorrect_view,
+        view=hide_empty_rows(state.segments.incorrect_view),
         # exclude the default columns
         **{key: table_settings[key] for key in table_settings if key != "columns"},
         # expand the default columns with a another one for comments
@@ -92,11 +138,17 @@ def create_tabs():
 
     # == Table for correct segments ==
     correct_segments_table = DataTable(
-        source=state.segments.correct_view, **table_settings
+        source=state.segments.correct_view,
+        view=hide_empty_rows(state.segments.correct_view),
+        **table_settings,
     )
 
     # == Table for new segments ==
-    new_segments_table = DataTable(source=state.segments.new_view, **table_settings)
+    new_segments_table = DataTable(
+        source=state.segments.new_view,
+        view=hide_empty_rows(state.segments.new_view),
+        **table_settings,
+    )
 
     # Define names and descriptions for the tables created above
     TABLES = {
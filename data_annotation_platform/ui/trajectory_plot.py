@@ -1,5 +1,12 @@
-from bokeh.models import ColumnDataSource, HoverTool
+from bokeh.models import (
+    BoxSelectTool,
+    ColumnDataSource,
+    CustomJSTransform,
+    HoverTool,
+    LassoSelectTool,
+)
 from bokeh.plotting import figure
+from bokeh.transform import linear_cmap, transform
 
 import ui.styles as styles
 
@@ -8,12 +15,24 @@ class TrajectoryPlot:
     """
     A class to represent the plot with trajectories. It set ups the plot with all the necessary settings.
 
+    Lines only carry a numeric style, which is mapped to their color and dash in the browser.
+    The legend is built from the same colors and dashes (see ui/styles.py), so they stay consistent.
+
+    Frames are either sent as raw RGBA arrays, or encoded as JPEG or WebP by the server and sent as data URIs
+    which the browser decodes. Encoded frames are many times smaller, which matters over slow connections.
+
     Attributes:
         trajectories: a DataFrame with broken trajectories data
         segments: a DataFrame with segments data
+        frame_format: the format frames are sent in, one of "rgba", "jpeg" or "webp"
     """
 
-    def __init__(self, trajectories, segments):
+    FRAME_FORMATS = ["rgba", "jpeg", "webp"]
+
+    def __init__(self, trajectories, segments, frame_format="rgba"):
+        if frame_format not in self.FRAME_FORMATS:
+            raise ValueError(f"Unknown frame format: {frame_format}")
+        self.frame_format = frame_format
         self.cap_w = 640
         self.cap_h = 360
         self.img_source = ColumnDataSource(data=dict(image=[]))
@@ -45,19 +64,33 @@ class TrajectoryPlot:
     def setup_renderers(self, trajectories, segments):
         """Adds renderers to the plot."""
 
-        self.img_plot = self.plot.image_rgba(
-            source=self.img_source,
-            image="image",
-            x=0,
-            y=0,
-            dw=self.cap_w,
-            dh=self.cap_h,
-            level="image",
-        )
+        if self.frame_format == "rgba":
+            self.img_plot = self.plot.image_rgba(
+                source=self.img_source,
+                image="image",
+                x=0,
+                y=0,
+                dw=self.cap_w,
+                dh=self.cap_h,
+                level="image",
+            )
+        else:
+            # The browser decodes the image from the data URI in the image column
+            self.img_plot = self.plot.image_url(
+                source=self.img_source,
+                url="image",
+                x=0,
+                y=0,
+                w=self.cap_w,
+                h=self.cap_h,
+                anchor="bottom_left",
+                retry_attempts=0,
+                level="image",
+            )
 
         self.trajectories_lines = self.plot.multi_line(
             source=trajectories.current_frame_view,
-            line_color="line_color",
+            line_color=self.map_colors(styles.TRAJECTORY_COLORS),
             line_alpha=0.8,
             line_width=2.0,
             line_dash="solid",
@@ -72,10 +105,16 @@ class TrajectoryPlot:
 
         self.segments_lines = self.plot.multi_line(
             source=segments.current_frame_view,
-            line_color="line_color",
+            line_color=self.map_colors(styles.SEGMENT_COLORS),
             line_alpha=0.8,
             line_width=2.0,
-            line_dash="line_dash",
+            line_dash=transform(
+                "line_style",
+                CustomJSTransform(
+                    args=dict(dashes=styles.SEGMENT_DASHES),
+                    v_func="return Array.from(xs, (x) => dashes[x])",
+                ),
+            ),
             hover_line_width=2.0,
             hover_line_alpha=1.0,
             selection_line_width=4.0,
@@ -84,56 +123,76 @@ class TrajectoryPlot:
             nonselection_line_alpha=0.7,
         )
 
+    @staticmethod
+    def map_colors(palette):
+        """Returns a color spec mapping the line_style column to the color at that position of the palette."""
+        # Every style falls in the middle of its color's interval, safe from rounding errors at the edges
+        return linear_cmap("line_style", palette, low=-0.5, high=len(palette) - 0.5)
+
+    def setup_tools(self):
+        """
+        Adds a hover tool and tools for selecting a region of the plot to the plot.
+        The browser can't hit test lines against a region, so the server selects the segments
+        within the region (see handle_region_selected in app/helpers.py).
+        """
+
+        self.plot.add_tools(
+            HoverTool(
+                show_arrow=False,
+                line_policy="nearest",
+                renderers=[self.trajectories_lines, self.segments_lines],
+                tooltips=[
+                    ("id", "@id"),
+                    ("frame_in", "@frame_in"),
+                    ("frame_out", "@frame_out"),
+                ],
+            ),
+            BoxSelectTool(renderers=[self.segments_lines]),
+            LassoSelectTool(
+                renderers=[self.segments_lines], select_every_mousemove=False
+            ),
+        )
+
+    def setup_legend(self):
+        """Configures the legend for the plot."""
+
         # Below renderers are only used for legend as the segments' line color and
         # dash are dynamic
         self.not_labeled = self.plot.multi_line(
-            line_color="red",
+            line_color=styles.SEGMENT_COLORS[0],
             line_alpha=0.8,
             line_width=2.0,
-            line_dash="dashed",
+            line_dash=styles.SEGMENT_DASHES[0],
             legend_label="not labeled segments",
         )
 
         self.labeled = self.plot.multi_line(
-            line_color="navy",
+            line_color=styles.SEGMENT_COLORS[1],
             line_alpha=0.8,
             line_width=2.0,
-            line_dash="solid",
+            line_dash=styles.SEGMENT_DASHES[1],
             legend_label="correct segments",
         )
 
         self.candidates = self.plot.multi_line(
-            line_color="brown",
+            line_color=styles.TRAJECTORY_COLORS[styles.CANDIDATE_STYLE],
             line_alpha=0.8,
             line_width=2.0,
             line_dash="solid",
             legend_label="candidate trajectories",
         )
 
-    def setup_tools(self):
-        """Adds a hover tool to the plot."""
-
-        self.plot.add_tools(
-            HoverTool(
-                show_arrow=False,
-                line_policy="nearest",
-                renderers=[self.trajectories_lines, self.segments_lines],
-                tooltips=[
-                    ("id", "@id"),
-                    ("frame_in", "@frame_in"),
-                    ("frame_out", "@frame_out"),
-                ],
-            )
-        )
-
-    def setup_legend(self):
-        """Configures the legend for the plot."""
         self.plot.legend.orientation = "horizontal"
         self.plot.legend.spacing = 15
         self.plot.legend.background_fill_alpha = 0.6
         self.plot.legend.border_line_dash = "solid"
         self.plot.legend.border_line_color = "black"
 
+    def get_img(self):
+        """Returns the frame image currently in the plot, None if there's none."""
+        images = self.img_plot.data_source.data["image"]
+        return images[0] if len(images) else None
+
     def update_img(self, img):
         """Helper method for updating the frame image in the plot."""
         self.img_plot.data_source.data["image"] = [img]